@@ -35,7 +35,19 @@ NEOMODEL_NEO4J_BOLT_URL = os.environ.get('NEO4J_BOLT_URL', 'bolt://neo4j:0123456
 NEOMODEL_SIGNALS = True
 NEOMODEL_FORCE_TIMEZONE = True
 NEOMODEL_ENCRYPTED_CONNECTION = False
-NEOMODEL_MAX_POOL_SIZE = 50
+# neomodel's connection is thread-local: every thread querying Neo4j opens its own driver with a pool of up to this many
+# connections. A thread runs one query at a time, so a worker process holds at most about NEOMODEL_MAX_POOL_SIZE times
+# its number of querying threads (NEO4J_QUERY_WORKERS plus the threads serving writes) connections
+NEOMODEL_MAX_POOL_SIZE = int(os.environ.get('NEO4J_THREAD_POOL_SIZE', 2))
+config.MAX_CONNECTION_POOL_SIZE = NEOMODEL_MAX_POOL_SIZE
+# Threads serving async read requests, one Neo4j query in flight each, bounding the concurrent reads of a worker process
+NEO4J_QUERY_WORKERS = int(os.environ.get('NEO4J_QUERY_WORKERS', 50))
+# Data access backend of the views, e7gzly.repositories.memory.InMemoryRepository runs without a database
+REPOSITORY_BACKEND = os.environ.get('REPOSITORY_BACKEND', 'e7gzly.repositories.graph.Neo4jRepository')
+# Warn on startup about indexes and constraints missing from the database, see manage.py install_schema
+NEO4J_SCHEMA_CHECK = os.environ.get('NEO4J_SCHEMA_CHECK', 'true').lower() == 'true'
+# Requests taking longer, in milliseconds, are logged along with their Cypher queries
+SLOW_REQUEST_THRESHOLD = float(os.environ.get('SLOW_REQUEST_THRESHOLD', 500))
 
 # Application definition
 
@@ -51,6 +63,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'e7gzly.instrumentation.query_instrumentation_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -89,10 +102,25 @@ ASGI_APPLICATION = "e7gzly-api.asgi.application"
 
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer'
+        'BACKEND': 'e7gzly.layers.UnixSocketChannelLayer',
+        'CONFIG': {
+            # Shared by all worker processes on the host and private to the user running them (mode 0700), defaults to
+            # a directory of that user under XDG_RUNTIME_DIR or the system temp directory
+            'socket_dir': os.environ.get('CHANNELS_SOCKET_DIR'),
+            # Names the sockets of this deployment, derived from SECRET_KEY when unset
+            'prefix': os.environ.get('CHANNELS_SOCKET_PREFIX')
+        }
     }
 }
 
+# Seat events received within this window (in seconds) are sent to websocket clients as a single frame
+RESERVATIONS_BROADCAST_WINDOW = float(os.environ.get('RESERVATIONS_BROADCAST_WINDOW', 0.05))
+
+# Number of worker processes serving the API on the host. Waiting room admissions and per-user rate limits are counted
+# in each process rather than in a shared store, so every process allows its share of the configured rates. They hold
+# as long as users are spread evenly over the workers
+WORKER_PROCESSES = int(os.environ.get('WORKER_PROCESSES', 1))
+
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
@@ -108,7 +136,16 @@ DATABASES = {
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'e7gzly.authentication.TokenAuthentication'
-    ]
+    ],
+    # Requests per user and period (second, minute, hour or day), see WORKER_PROCESSES
+    'DEFAULT_THROTTLE_CLASSES': [
+        'e7gzly.throttling.UserReadRateThrottle',
+        'e7gzly.throttling.UserWriteRateThrottle'
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'user_reads': os.environ.get('USER_READ_RATE', '300/min'),
+        'user_writes': os.environ.get('USER_WRITE_RATE', '30/min')
+    }
 }
 
 # Password validation
@@ -130,6 +167,13 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing runs on this many processes, with at most PASSWORD_HASHING_MAX_PENDING calls in flight before
+# requests are answered with 503
+
+PASSWORD_HASHING_WORKERS = int(os.environ.get('PASSWORD_HASHING_WORKERS', os.cpu_count() or 1))
+PASSWORD_HASHING_MAX_PENDING = int(os.environ.get('PASSWORD_HASHING_MAX_PENDING', 64))
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.1/topics/i18n/
 
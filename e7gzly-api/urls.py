@@ -24,6 +24,9 @@ urlpatterns = [
     path('user/', UserDetailsView.as_view(), name='user details'),
     path('matches/', MatchView.as_view(), name='matches'),
     path('match/', MatchDetailsView.as_view(), name='match details'),
+    path('match/seats/', SeatMapView.as_view(), name='match seats'),
     path('stadiums/', StadiumView.as_view(), name='stadiums'),
-    path('reservations/', ReservationView.as_view(), name='reservations')
+    path('reservations/', ReservationView.as_view(), name='reservations'),
+    path('reservations/holds/', HoldView.as_view(), name='holds'),
+    path('metrics/', MetricsView.as_view(), name='metrics')
 ]
@@ -0,0 +1,183 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core import signing
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .cache import TTLCache
+from .constants import ADMISSION_PASS_TTL, ADMISSION_POSITION_INTERVAL, ADMISSION_SPENT_PASSES_MAX_SIZE
+from .invalidation import invalidate, listen_for_invalidations, on_invalidation
+
+_signer = signing.TimestampSigner(salt='e7gzly.admission')
+spent_passes = TTLCache(ADMISSION_SPENT_PASSES_MAX_SIZE, ADMISSION_PASS_TTL)
+_spend_lock = threading.Lock()
+
+
+class AdmissionRequired(APIException):
+    status_code = status.HTTP_403_FORBIDDEN
+    default_detail = 'The match is in waiting room mode, a valid admission pass is required'
+    default_code = 'admission_required'
+
+
+def issue_pass(match_id, username):
+    return _signer.sign("{}:{}".format(match_id, username))
+
+
+@on_invalidation('admission_pass')
+def _spend(admission_pass):
+    spent_passes.set(admission_pass, True)
+
+
+def check_pass(admission_pass, match_id, username):
+    if not admission_pass:
+        return False
+    try:
+        value = _signer.unsign(admission_pass, max_age=ADMISSION_PASS_TTL)
+    except signing.BadSignature:
+        return False
+    return value == "{}:{}".format(match_id, username)
+
+
+def spend_pass(admission_pass, match_id, username):
+    """
+    Spend a pass of the user for the match, returns False if it is invalid or already spent. The pass is refused from
+    then on in every worker process of the host
+    """
+    if not check_pass(admission_pass, match_id, username):
+        return False
+    listen_for_invalidations()
+    with _spend_lock:
+        if spent_passes.get(admission_pass):
+            return False
+        spent_passes.set(admission_pass, True)
+    invalidate('admission_pass', admission_pass)
+    return True
+
+
+class TokenBucket:
+    """
+    Refills at a fixed rate of tokens per second up to a burst size
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        """
+        Take a token, returns 0 if one was available, otherwise the seconds until one is
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def refill_time(self):
+        """
+        Seconds until the bucket is full again
+        """
+        tokens = self.tokens + (time.monotonic() - self.updated) * self.rate
+        return max(0, (self.burst - tokens) / self.rate)
+
+
+class WaitingRoom:
+    """
+    First come, first served admission queue of a match, letting the waiting consumers in at the pace of a token
+    bucket and reporting their queue positions at most every ADMISSION_POSITION_INTERVAL seconds
+    """
+
+    def __init__(self, rate, on_empty=None):
+        self.bucket = TokenBucket(rate, max(rate, 1))
+        self.waiting = OrderedDict()
+        self.task = None
+        self.on_empty = on_empty
+
+    @property
+    def is_empty(self):
+        return not self.waiting and self.task is None
+
+    def set_rate(self, rate):
+        self.bucket.rate, self.bucket.burst = rate, max(rate, 1)
+
+    async def join(self, consumer):
+        self.waiting[consumer.channel_name] = consumer
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.admit_waiting())
+        else:
+            await consumer.send_position(len(self.waiting))
+
+    def leave(self, consumer):
+        self.waiting.pop(consumer.channel_name, None)
+
+    async def send_positions(self):
+        for position, consumer in enumerate(list(self.waiting.values()), 1):
+            await consumer.send_position(position)
+
+    async def admit_waiting(self):
+        reported = 0
+        try:
+            while self.waiting:
+                wait = self.bucket.take()
+                if wait:
+                    if time.monotonic() - reported >= ADMISSION_POSITION_INTERVAL:
+                        await self.send_positions()
+                        reported = time.monotonic()
+                    await asyncio.sleep(wait)
+                    continue
+                _, consumer = self.waiting.popitem(last=False)
+                await consumer.admit()
+        finally:
+            self.task = None
+            if self.is_empty and self.on_empty is not None:
+                self.on_empty()
+
+
+class WaitingRoomRegistry:
+    """
+    Waiting rooms of the serving process by match, admitting at its share of the match's rate
+    """
+
+    def __init__(self):
+        self._rooms = {}
+
+    async def join(self, match_id, rate, consumer):
+        rate /= settings.WORKER_PROCESSES
+        room = self._rooms.get(match_id)
+        if room is None:
+            room = self._rooms[match_id] = WaitingRoom(rate, on_empty=lambda: self.discard(match_id))
+        else:
+            room.set_rate(rate)
+        await room.join(consumer)
+
+    def leave(self, match_id, consumer):
+        room = self._rooms.get(match_id)
+        if room is None:
+            return
+        room.leave(consumer)
+        self.discard(match_id)
+
+    def discard(self, match_id):
+        """
+        Drop the room of a match once nobody waits in it any more. A room that admitted users lately is kept until its
+        bucket refills, so that users joining right after are not let in beyond the rate
+        """
+        room = self._rooms.get(match_id)
+        if room is None or not room.is_empty:
+            return
+        delay = room.bucket.refill_time()
+        if delay:
+            asyncio.get_running_loop().call_later(delay, self.discard, match_id)
+        else:
+            del self._rooms[match_id]
+
+
+waiting_rooms = WaitingRoomRegistry()
@@ -3,3 +3,14 @@ from django.apps import AppConfig
 
 class E7gzlyConfig(AppConfig):
     name = 'e7gzly'
+
+    def ready(self):
+        from channels.layers import get_channel_layer
+        from . import checks  # noqa: F401
+        from .instrumentation import instrument_cypher_queries
+        from .layers import UnixSocketChannelLayer
+        instrument_cypher_queries()
+        # Fail on startup rather than on the first request that publishes a group message
+        channel_layer = get_channel_layer()
+        if isinstance(channel_layer, UnixSocketChannelLayer):
+            channel_layer.check_directory()
@@ -1,6 +1,54 @@
+import copy
+
 from rest_framework.authentication import BaseAuthentication, get_authorization_header
 from rest_framework.exceptions import AuthenticationFailed
-from .models import Token
+
+from .cache import TTLCache
+from .constants import AUTH_CACHE_MAX_SIZE, AUTH_CACHE_TTL
+from .invalidation import invalidate, listen_for_invalidations, on_invalidation
+from .repositories import repository
+
+token_cache = TTLCache(AUTH_CACHE_MAX_SIZE, AUTH_CACHE_TTL)
+
+
+@on_invalidation('token')
+def _drop_token(key):
+    token_cache.pop(key)
+
+
+def forget_token(key):
+    """
+    Drop a cached token in every worker process of the host, a dropped message expires with AUTH_CACHE_TTL
+    """
+    invalidate('token', key)
+
+
+def forget_user(user):
+    key = repository.token_key(user)
+    if key is not None:
+        forget_token(key)
+
+
+def authenticate_token(key):
+    """
+    (user, token) of a token key, raises AuthenticationFailed if either doesn't exist. The user is a copy of the
+    cached one, so that a request changing it never leaks into the others
+    """
+    listen_for_invalidations()
+    credentials = token_cache.get(key)
+    if credentials is not None:
+        return copy.copy(credentials[0]), credentials[1]
+
+    generation = token_cache.generation
+    credentials = repository.token_user(key)
+    if credentials is None:
+        raise AuthenticationFailed('Invalid token')
+
+    if credentials[0] is None:
+        raise AuthenticationFailed("User doesn't exist/deleted")
+
+    token_cache.set(key, (copy.copy(credentials[0]), credentials[1]), generation)
+    return credentials
 
 
 class TokenAuthentication(BaseAuthentication):
@@ -22,15 +70,7 @@ class TokenAuthentication(BaseAuthentication):
         except UnicodeError:
             raise AuthenticationFailed('Invalid token header. Token string should not contain invalid characters')
 
-        try:
-            token = Token.nodes.get(key=key)
-        except Token.DoesNotExist:
-            raise AuthenticationFailed('Invalid token')
-
-        if token.user.single() is None:
-            raise AuthenticationFailed("User doesn't exist/deleted")
-
-        return token.user.single(), token
+        return authenticate_token(key)
 
     def authenticate_header(self, request):
         return self.keyword
@@ -0,0 +1,230 @@
+import asyncio
+import datetime
+import importlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.hashers import make_password
+from django.test import Client
+from django.utils import timezone
+
+from .constants import TEAMS, CITIES, GENDERS, TICKET_CANCELLATION_WINDOW
+from .occupancy import seat_maps
+from .repositories import repository
+from .utilities import number_to_row
+
+SERVER_TIMING_QUERIES = re.compile(r'db;desc="(\d+) queries"')
+PASSWORD = 'benchmark-password'
+# Metric, whether higher values are better
+METRICS = (('throughput', True), ('p50_ms', False), ('p99_ms', False), ('queries_per_request', False))
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def summarize(latencies, seconds, queries=None, statuses=None):
+    result = {
+        'requests': len(latencies),
+        'throughput': round(len(latencies) / seconds, 1) if seconds else None,
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2)
+    }
+    if queries is not None:
+        result['queries_per_request'] = round(sum(queries) / len(queries), 2)
+    if statuses is not None:
+        result['statuses'] = {str(code): statuses.count(code) for code in sorted(set(statuses))}
+    return result
+
+
+class Fixture:
+    """
+    A stadium hosting two upcoming matches and a pool of authorized fans, created through the configured repository
+    under a random name so that they can be deleted after the run without touching other data
+    """
+
+    def __init__(self, users):
+        self.name = 'benchmark-{}'.format(uuid.uuid4().hex[:12])
+        self.stadium = repository.create_stadium({'name': self.name, 'capacity': 30000, 'vip_rows': 15,
+                                                  'vip_seats_per_row': 10})
+        self.matches = []
+        for home_team, away_team in (TEAMS[:2], TEAMS[2:4]):
+            self.matches.append(repository.create_match({
+                'home_team': home_team[0],
+                'away_team': away_team[0],
+                'date': timezone.now() + datetime.timedelta(days=TICKET_CANCELLATION_WINDOW + 30),
+                'referee': 'Benchmark Referee',
+                'linesmen': ['Benchmark Linesman', 'Benchmark Linesman']
+            }, self.stadium))
+        password = make_password(PASSWORD)
+        self.usernames = ['{}-{}'.format(self.name, index) for index in range(users)]
+        repository.import_users([{
+            'username': username,
+            'email': '{}@example.com'.format(username),
+            'password': password,
+            'first_name': 'Benchmark',
+            'last_name': 'Fan',
+            'birthdate': datetime.date(1990, 1, 1),
+            'gender': GENDERS[0][0],
+            'city': CITIES[0][0],
+            'role': 'fan',
+            'authorized': True
+        } for username in self.usernames])
+
+    @property
+    def seat_ids(self):
+        return ['{}{}'.format(number_to_row(row), seat) for row in range(self.stadium.vip_rows)
+                for seat in range(self.stadium.vip_seats_per_row)]
+
+    def delete(self):
+        repository.delete_stadium(self.stadium)
+        for username in self.usernames:
+            user = repository.get_user(username)
+            if user is not None:
+                repository.delete_user(user)
+        for match in self.matches:
+            seat_maps.discard(match.match_id)
+
+
+class Benchmark:
+    """
+    Drives the hot endpoints in-process through the full middleware stack with concurrent clients
+    """
+
+    def __init__(self, fixture, concurrency, requests, seed=0):
+        self.fixture = fixture
+        self.concurrency = concurrency
+        self.requests = requests
+        self.random = random.Random(seed)
+        self._local = threading.local()
+        self.tokens = []
+
+    @property
+    def client(self):
+        if not hasattr(self._local, 'client'):
+            self._local.client = Client()
+        return self._local.client
+
+    def run_http(self, requests):
+        """
+        Send the given (method, path, data, headers) requests over concurrent clients
+        """
+        def send(request):
+            method, path, data, headers = request
+            started = time.perf_counter()
+            if method == 'get':
+                response = self.client.get(path, data, **headers)
+            else:
+                response = getattr(self.client, method)(path, json.dumps(data), content_type='application/json',
+                                                        **headers)
+            latency = time.perf_counter() - started
+            queries = SERVER_TIMING_QUERIES.search(response.get('Server-Timing', ''))
+            return latency, int(queries.group(1)) if queries else 0, response.status_code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            results = list(executor.map(send, requests))
+        seconds = time.perf_counter() - started
+        latencies, queries, statuses = zip(*results)
+        return summarize(latencies, seconds, queries, list(statuses))
+
+    def issue_tokens(self):
+        """
+        Log every user in once for the authenticated scenarios, a later login invalidates these tokens
+        """
+        self.tokens = [Client().post('/account/login/', {'username': username, 'password': PASSWORD},
+                                     content_type='application/json').json()['token']
+                       for username in self.fixture.usernames]
+
+    def login(self):
+        usernames = self.fixture.usernames
+        self.tokens = []
+        return self.run_http([('post', '/account/login/',
+                               {'username': usernames[index % len(usernames)], 'password': PASSWORD}, {})
+                              for index in range(self.requests)])
+
+    def matches(self):
+        return self.run_http([('get', '/matches/', {}, {})] * self.requests)
+
+    def match_details(self):
+        match_id = self.fixture.matches[0].match_id
+        return self.run_http([('get', '/match/', {'id': match_id}, {})] * self.requests)
+
+    def reserve(self):
+        """
+        Every client tries to reserve seats among the first two rows of the same match, most of them conflict
+        """
+        match_id = self.fixture.matches[0].match_id
+        hot_seat_ids = self.fixture.seat_ids[:2 * self.fixture.stadium.vip_seats_per_row]
+        return self.run_http([('post', '/reservations/',
+                               {'match_id': match_id, 'seat_id': self.random.choice(hot_seat_ids)},
+                               {'HTTP_AUTHORIZATION': 'Bearer {}'.format(self.tokens[index % len(self.tokens)])})
+                              for index in range(self.requests)])
+
+    def fanout(self, consumers):
+        return asyncio.run(self._fanout(consumers))
+
+    async def _fanout(self, consumers):
+        """
+        Reserve seats one at a time while the given number of websocket consumers watch the match, the latency is
+        measured from the reservation request until every consumer received the seat
+        """
+        routing = importlib.import_module('e7gzly-api.routing')
+        application = URLRouter(routing.websocket_urlpatterns)
+        match_id = self.fixture.matches[1].match_id
+        communicators = [WebsocketCommunicator(application, 'match/reservations/{}'.format(match_id))
+                         for _ in range(consumers)]
+        for communicator in communicators:
+            await communicator.connect()
+            await communicator.receive_from()
+        headers = {'HTTP_AUTHORIZATION': 'Bearer {}'.format(self.tokens[0])}
+        post = sync_to_async(self.client.post, thread_sensitive=False)
+
+        async def receive(communicator, seat_id):
+            while True:
+                frame = json.loads(await communicator.receive_from(timeout=5))
+                if seat_id in frame.get('seat_ids', []):
+                    return
+
+        latencies = []
+        seat_ids = self.fixture.seat_ids[:self.requests]
+        started = time.perf_counter()
+        for seat_id in seat_ids:
+            sent = time.perf_counter()
+            await post('/reservations/', json.dumps({'match_id': match_id, 'seat_id': seat_id}),
+                       content_type='application/json', **headers)
+            await asyncio.gather(*(receive(communicator, seat_id) for communicator in communicators))
+            latencies.append(time.perf_counter() - sent)
+        seconds = time.perf_counter() - started
+        for communicator in communicators:
+            await communicator.disconnect()
+        result = summarize(latencies, seconds)
+        result['consumers'] = consumers
+        result['frames_per_second'] = round(len(latencies) * consumers / seconds, 1)
+        return result
+
+
+def compare(results, baseline, tolerance):
+    """
+    Yield (scenario, metric, baseline, current, relative change, regressed) for the metrics found in both runs
+    """
+    for scenario, result in results.items():
+        for metric, higher_is_better in METRICS:
+            current = result.get(metric)
+            previous = baseline.get(scenario, {}).get(metric)
+            if current is None or not previous:
+                continue
+            change = (current - previous) / previous
+            regressed = -change > tolerance if higher_is_better else change > tolerance
+            yield scenario, metric, previous, current, change, regressed
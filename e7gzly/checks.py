@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+from neo4j.exceptions import DriverError, Neo4jError
+
+from .repositories import repository
+from .repositories.graph import Neo4jRepository
+from .schema import rule_name, verify_schema
+
+
+@register()
+def schema_check(app_configs, **kwargs):
+    """
+    Warn about declared indexes and constraints that are missing from the database
+    """
+    if not settings.NEO4J_SCHEMA_CHECK or not isinstance(repository, Neo4jRepository):
+        return []
+    try:
+        problems = verify_schema()
+    except (DriverError, Neo4jError) as e:
+        return [Warning("Could not verify the database schema: {}".format(e), id='e7gzly.W001')]
+    return [Warning("{} is {}".format(rule_name(rule), state or 'missing'),
+                    hint="Run python manage.py install_schema", id='e7gzly.W002')
+            for rule, state in problems.items()]
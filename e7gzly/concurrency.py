@@ -0,0 +1,51 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.views import APIView
+
+# Created on first use rather than on import. neomodel's db is thread-local, so every thread of the executor opens its
+# own driver and the number of threads, NEO4J_QUERY_WORKERS, is what bounds the reads in flight
+database_executor = SimpleLazyObject(
+    lambda: ThreadPoolExecutor(max_workers=settings.NEO4J_QUERY_WORKERS, thread_name_prefix='neo4j'))
+
+
+async def run_in_database_executor(func, *args, **kwargs):
+    """
+    Run a blocking neomodel call on the database executor, at most NEO4J_QUERY_WORKERS at a time
+    """
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        database_executor, functools.partial(context.run, func, *args, **kwargs))
+
+
+class AsyncReadAPIView(APIView):
+    """
+    API view with an async entry point that serves safe requests on the database executor, so that up to
+    NEO4J_QUERY_WORKERS reads are in flight instead of queuing behind the thread shared by sync views
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+
+        def render_view(request, *args, **kwargs):
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+            return response
+
+        async def async_view(request, *args, **kwargs):
+            if request.method in SAFE_METHODS:
+                return await run_in_database_executor(render_view, request, *args, **kwargs)
+            return await sync_to_async(view)(request, *args, **kwargs)
+
+        async_view.cls = view.cls
+        async_view.initkwargs = view.initkwargs
+        async_view.csrf_exempt = True
+        return async_view
@@ -13,6 +13,26 @@ DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
 TOKEN_MAX_LEN = 40
 MIN_AGE = 16
 TICKET_CANCELLATION_WINDOW = 3
+MAX_SEATS_PER_RESERVATION = 6
+USERS_IMPORT_BATCH_SIZE = 500
+MAX_USERS_PER_AUTHORIZATION = 1000
+SEAT_MAPS_MAX_SIZE = 1000
+SEAT_MAP_DELTAS_MAX_SIZE = 256
+SEAT_MAP_REVALIDATE_INTERVAL = 5
+CHANNEL_MESSAGE_MAX_SIZE = 65536
+SEAT_LAYOUTS_MAX_SIZE = 128
+SEAT_HOLD_TTL = 120
+HOLDS_EXPIRY_BATCH_SIZE = 500
+RESERVATION_KEYS_BACKFILL_BATCH_SIZE = 5000
+ADMISSION_PASS_TTL = 300
+ADMISSION_POSITION_INTERVAL = 2
+ADMISSION_SPENT_PASSES_MAX_SIZE = 100000
+AUTH_CACHE_MAX_SIZE = 10000
+AUTH_CACHE_TTL = 10
+RESPONSE_CACHE_MAX_SIZE = 1000
+RESPONSE_CACHE_TTL = 30
+REQUEST_DURATION_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+REQUEST_QUERIES_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
 
 GENDERS = (
     ('male', 'Male'),
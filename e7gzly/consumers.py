@@ -1,24 +1,144 @@
+import asyncio
 import json
+from urllib.parse import parse_qs
 
-from asgiref.sync import async_to_sync
-from channels.generic.websocket import WebsocketConsumer
+from asgiref.sync import sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from rest_framework.exceptions import AuthenticationFailed
 
+from .admission import issue_pass, waiting_rooms
+from .authentication import authenticate_token
+from .constants import ADMISSION_PASS_TTL
+from .occupancy import seat_maps, merge_deltas, Delta
+from .repositories import repository
 
-class ReservationsConsumer(WebsocketConsumer):
 
-    def connect(self):
+class ReservationsConsumer(AsyncWebsocketConsumer):
+    """
+    Streams the seat map of a match: a snapshot on connect (or the missed deltas when resuming with ?since=<seq>)
+    followed by sequence-numbered deltas. Users joining with their token are queued in the match's waiting room,
+    receiving their queue position until they are sent an admission pass
+    """
+    flush_task = None
+    seq = None
+    user = None
+
+    async def connect(self):
         self.match_id = self.scope['url_route']['kwargs']['match_id']
-        async_to_sync(self.channel_layer.group_add)(
+        self.pending_deltas = []
+        self.waiting_deltas = {}
+        await self.channel_layer.group_add(
             self.match_id,
             self.channel_name
         )
-        self.accept()
+        await self.accept()
+        try:
+            since = int(parse_qs(self.scope['query_string'].decode())['since'][0])
+        except (KeyError, ValueError):
+            since = None
+        changes = None
+        if since is not None:
+            changes = await sync_to_async(seat_maps.deltas_since, thread_sensitive=False)(self.match_id, since)
+        if changes is None:
+            await self.send_snapshot()
+            return
+        self.seq, deltas = changes
+        if deltas:
+            await self.send_deltas(deltas)
+
+    async def send_snapshot(self):
+        snapshot = await sync_to_async(seat_maps.snapshot, thread_sensitive=False)(self.match_id)
+        if snapshot is None:
+            await self.close()
+            return
+        self.seq = snapshot['seq']
+        self.pending_deltas = [delta for delta in self.pending_deltas if delta.seq > self.seq]
+        self.waiting_deltas = {seq: delta for seq, delta in self.waiting_deltas.items() if seq > self.seq}
+        await self.send(text_data=json.dumps(dict(snapshot, type='snapshot')))
+        self.advance()
+
+    async def send_deltas(self, deltas):
+        reserved, released = merge_deltas(deltas)
+        frame = {'type': 'delta', 'seq': deltas[-1].seq, 'seat_ids': reserved}
+        if released:
+            frame['released_seat_ids'] = released
+        await self.send(text_data=json.dumps(frame))
+
+    def advance(self):
+        while self.seq + 1 in self.waiting_deltas:
+            self.seq += 1
+            self.pending_deltas.append(self.waiting_deltas.pop(self.seq))
+        if (self.pending_deltas or self.waiting_deltas) and self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(self.flush())
+
+    async def update(self, event):
+        delta = Delta(event['seq'], event.get('seat_ids', []), event.get('released_seat_ids', []))
+        if self.seq is None or delta.seq <= self.seq:
+            return
+        self.waiting_deltas[delta.seq] = delta
+        self.advance()
+
+    async def flush(self):
+        """
+        Send the deltas received within the broadcast window as a single frame
+        """
+        await asyncio.sleep(settings.RESERVATIONS_BROADCAST_WINDOW)
+        deltas, self.pending_deltas = self.pending_deltas, []
+        self.flush_task = None
+        if deltas:
+            await self.send_deltas(deltas)
+        if self.waiting_deltas:
+            # The deltas in between did not arrive within the window, start over from a fresh snapshot
+            await self.send_snapshot()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            message = json.loads(text_data or '')
+        except ValueError:
+            return
+        if isinstance(message, dict) and message.get('type') == 'join':
+            await self.join(str(message.get('token')))
+
+    async def join(self, key):
+        """
+        Queue the user in the match's waiting room, or admit them right away if the match has none
+        """
+        if self.user is not None:
+            return
+        try:
+            user, _ = await sync_to_async(authenticate_token, thread_sensitive=False)(key)
+        except AuthenticationFailed as e:
+            await self.send(text_data=json.dumps({'type': 'error', 'detail': str(e.detail)}))
+            return
+        if not (user.authorized or user.role == 'admin'):
+            await self.send(text_data=json.dumps({'type': 'error', 'detail': 'Only authorized users can be admitted'}))
+            return
+        match = await sync_to_async(repository.get_match, thread_sensitive=False)(self.match_id)
+        if match is None:
+            await self.close()
+            return
+        self.user = user
+        if match.admission_rate is None:
+            await self.admit()
+            return
+        await waiting_rooms.join(self.match_id, match.admission_rate, self)
+
+    async def send_position(self, position):
+        await self.send(text_data=json.dumps({'type': 'queue', 'position': position}))
 
-    def update(self, event):
-        self.send(text_data=json.dumps({'seat_id': event["seat_id"]}))
+    async def admit(self):
+        await self.send(text_data=json.dumps({
+            'type': 'admission',
+            'pass': issue_pass(self.match_id, self.user.username),
+            'expires_in': ADMISSION_PASS_TTL
+        }))
 
-    def disconnect(self, close_code):
-        async_to_sync(self.channel_layer.group_discard)(
+    async def disconnect(self, close_code):
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+        waiting_rooms.leave(self.match_id, self)
+        await self.channel_layer.group_discard(
             self.match_id,
             self.channel_name
         )
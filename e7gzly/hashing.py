@@ -0,0 +1,85 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import hashers
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class HashingUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many passwords are being processed, try again later'
+    default_code = 'hashing_unavailable'
+
+
+def _setup_worker():
+    # Workers are spawned, they start from a fresh interpreter rather than a copy of the serving process
+    if not apps.ready:
+        django.setup()
+
+
+def _make_password(password):
+    return hashers.make_password(password)
+
+
+def _check_password(password, encoded):
+    rehashed = []
+    correct = hashers.check_password(password, encoded,
+                                     setter=lambda raw_password: rehashed.append(hashers.make_password(raw_password)))
+    return correct, rehashed[0] if rehashed else None
+
+
+class PasswordHasher:
+    """
+    Runs password hashing on a process pool, rejecting work with HashingUnavailable once max_pending calls are
+    already in flight
+    """
+
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                # Forking would copy the locks held by the threads of the serving process (channel layer, database
+                # executor, Neo4j driver) into the workers, where nothing ever releases them
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_setup_worker,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingUnavailable()
+        try:
+            return self.executor.submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+    def make_password(self, password):
+        return self._run(_make_password, password)
+
+    def make_passwords(self, passwords):
+        """
+        Hash a batch of passwords across all the workers, regardless of the pending calls limit
+        """
+        passwords = list(passwords)
+        chunk_size = max(1, len(passwords) // (self.workers * 4))
+        return list(self.executor.map(_make_password, passwords, chunksize=chunk_size))
+
+    def check_password(self, password, encoded):
+        """
+        Returns whether the password matches the encoded one and, if it does but was encoded with outdated hasher
+        parameters, the password encoded with the current ones
+        """
+        return self._run(_check_password, password, encoded)
+
+
+password_hasher = PasswordHasher(settings.PASSWORD_HASHING_WORKERS, settings.PASSWORD_HASHING_MAX_PENDING)
@@ -0,0 +1,139 @@
+import asyncio
+import bisect
+import contextvars
+import functools
+import itertools
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+from neomodel import db
+
+from .constants import REQUEST_DURATION_BUCKETS, REQUEST_QUERIES_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+# (query, milliseconds) of every Cypher query run on behalf of the current request, shared with executor threads
+_queries = contextvars.ContextVar('cypher_queries', default=None)
+
+
+def instrument_cypher_queries():
+    """
+    Wrap neomodel's cypher_query to record the queries of the request being served, idempotent
+    """
+    cypher_query = type(db).cypher_query
+    if getattr(cypher_query, 'instrumented', False):
+        return
+
+    @functools.wraps(cypher_query)
+    def instrumented_cypher_query(self, query, *args, **kwargs):
+        queries = _queries.get()
+        if queries is None:
+            return cypher_query(self, query, *args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return cypher_query(self, query, *args, **kwargs)
+        finally:
+            queries.append((query, (time.perf_counter() - started) * 1000))
+
+    instrumented_cypher_query.instrumented = True
+    type(db).cypher_query = instrumented_cypher_query
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 3),
+            'buckets': [{'le': bound, 'count': count}
+                        for bound, count in zip(list(self.buckets) + ['+Inf'], itertools.accumulate(self.counts))]
+        }
+
+
+class ViewMetrics:
+    """
+    Per-view histograms of the request duration and the number of Cypher queries, local to the worker process
+    """
+
+    def __init__(self):
+        self._views = {}
+        self._lock = threading.Lock()
+
+    def observe(self, view, duration, queries):
+        with self._lock:
+            histograms = self._views.get(view)
+            if histograms is None:
+                histograms = self._views[view] = (Histogram(REQUEST_DURATION_BUCKETS),
+                                                  Histogram(REQUEST_QUERIES_BUCKETS))
+            histograms[0].observe(duration)
+            histograms[1].observe(queries)
+
+    def to_dict(self):
+        with self._lock:
+            return {view: {'duration_ms': duration.to_dict(), 'queries': queries.to_dict()}
+                    for view, (duration, queries) in sorted(self._views.items())}
+
+    def clear(self):
+        with self._lock:
+            self._views.clear()
+
+
+view_metrics = ViewMetrics()
+
+
+def _finish_request(request, response, queries, started):
+    duration = (time.perf_counter() - started) * 1000
+    database_duration = sum(query_duration for _, query_duration in queries)
+    response['Server-Timing'] = 'db;desc="{} queries";dur={:.1f}, total;dur={:.1f}'.format(
+        len(queries), database_duration, duration)
+    resolver_match = request.resolver_match
+    if resolver_match is not None:
+        view_metrics.observe("{} {}".format(request.method, resolver_match.route), duration, len(queries))
+    if duration >= settings.SLOW_REQUEST_THRESHOLD:
+        logger.warning("Slow request %s %s took %.1fms with %d queries (%.1fms)%s",
+                       request.method, request.get_full_path(), duration, len(queries), database_duration,
+                       ''.join("\n  {:.1f}ms {}".format(query_duration, ' '.join(query.split()))
+                               for query, query_duration in queries))
+    return response
+
+
+@sync_and_async_middleware
+def query_instrumentation_middleware(get_response):
+    """
+    Count and time the Cypher queries of every request, report them in a Server-Timing header, log slow requests
+    along with their queries and record per-view metrics
+    """
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            queries = []
+            token = _queries.set(queries)
+            started = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                _queries.reset(token)
+            return _finish_request(request, response, queries, started)
+    else:
+        def middleware(request):
+            queries = []
+            token = _queries.set(queries)
+            started = time.perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                _queries.reset(token)
+            return _finish_request(request, response, queries, started)
+    return middleware
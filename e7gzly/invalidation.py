@@ -0,0 +1,68 @@
+import logging
+import threading
+
+from channels.layers import get_channel_layer
+
+from .layers import UnixSocketChannelLayer
+
+logger = logging.getLogger(__name__)
+
+INVALIDATIONS_GROUP = 'invalidations'
+
+_handlers = {}
+_listening = False
+_listening_lock = threading.Lock()
+
+
+def on_invalidation(kind):
+    """
+    Register the handler of an invalidation kind, called with the invalidated value in every worker process. Handlers
+    should be idempotent, the worker that invalidates also receives its own message
+    """
+    def decorator(handler):
+        _handlers[kind] = handler
+        return handler
+    return decorator
+
+
+def _apply(message):
+    handler = _handlers.get(message.get('kind'))
+    if handler is None:
+        logger.warning("Dropped an invalidation of unknown kind %r", message.get('kind'))
+        return
+    handler(message.get('value'))
+
+
+def listen_for_invalidations():
+    """
+    Start applying the invalidations of the other workers, once per process
+    """
+    global _listening
+    if _listening:
+        return
+    with _listening_lock:
+        if _listening:
+            return
+        try:
+            channel_layer = get_channel_layer()
+            if isinstance(channel_layer, UnixSocketChannelLayer):
+                channel_layer.add_listener(INVALIDATIONS_GROUP, _apply)
+        except Exception:
+            # The caches still expire on their own, listening is attempted again by the next caller
+            logger.exception("Could not listen for invalidations")
+            return
+        _listening = True
+
+
+def invalidate(kind, value):
+    """
+    Apply an invalidation in this process right away and publish it to the other workers of the host. Publishing is
+    best-effort, the other workers catch up once their entries expire if it fails
+    """
+    _handlers[kind](value)
+    try:
+        channel_layer = get_channel_layer()
+        if isinstance(channel_layer, UnixSocketChannelLayer):
+            channel_layer.broadcast(INVALIDATIONS_GROUP, {'kind': kind, 'value': value})
+    except Exception:
+        logger.exception("Could not publish the %s invalidation", kind)
@@ -0,0 +1,209 @@
+import asyncio
+import atexit
+import hashlib
+import json
+import logging
+import os
+import socket
+import stat
+import tempfile
+import threading
+import uuid
+from collections import defaultdict
+
+from channels.layers import InMemoryChannelLayer
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .constants import CHANNEL_MESSAGE_MAX_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def private_directory(path):
+    """
+    Create a directory only the current user can access, raises ImproperlyConfigured if it already exists with
+    another owner or with permissions that let other users in
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode):
+        raise ImproperlyConfigured("The channel layer socket directory {} is not a directory".format(path))
+    if info.st_uid != os.geteuid():
+        raise ImproperlyConfigured("The channel layer socket directory {} is owned by another user".format(path))
+    if info.st_mode & 0o077:
+        raise ImproperlyConfigured("The channel layer socket directory {} is accessible by other users, its mode "
+                                   "should be 0700".format(path))
+
+
+def default_socket_dir():
+    """
+    Socket directory of the current user, under its runtime directory when it has one
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'e7gzly')
+    return os.path.join(tempfile.gettempdir(), 'e7gzly-{}'.format(os.geteuid()))
+
+
+class UnixSocketChannelLayer(InMemoryChannelLayer):
+    """
+    In-memory channel layer whose group messages reach every worker process of the deployment on the host. Each
+    worker binds its own Unix datagram socket, named after a per-deployment prefix, within a directory private to the
+    user running the workers, and receives on it from a thread. A group message is handed to the process listeners of
+    the group as well as to its channels
+    """
+
+    def __init__(self, socket_dir=None, prefix=None, **kwargs):
+        super().__init__(**kwargs)
+        self.socket_dir = socket_dir or default_socket_dir()
+        # Deployments sharing a socket directory only hear each other when they share the secret key
+        self.prefix = prefix or hashlib.sha256(settings.SECRET_KEY.encode()).hexdigest()[:16]
+        self.socket_path = None
+        self._socket = None
+        self._sender = None
+        self._directory_checked = False
+        self._loop = None
+        self._listeners = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def check_directory(self):
+        """
+        Create the socket directory, raises ImproperlyConfigured if other users can access it
+        """
+        if not self._directory_checked:
+            private_directory(self.socket_dir)
+            self._directory_checked = True
+
+    def listen(self):
+        """
+        Bind the worker's socket and start receiving group messages, once
+        """
+        with self._lock:
+            if self._socket is not None:
+                return
+            self.check_directory()
+            path = os.path.join(self.socket_dir, '{}-{}-{}.sock'.format(self.prefix, os.getpid(), uuid.uuid4().hex[:8]))
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.bind(path)
+            sock.settimeout(1)
+            self._socket, self.socket_path = sock, path
+        atexit.register(self._unlink, path)
+        threading.Thread(target=self._receive, args=(sock,), name='channel-layer', daemon=True).start()
+
+    def add_listener(self, group, callback):
+        """
+        Call back with every message sent to the group by any worker, from the receiving thread
+        """
+        with self._lock:
+            if callback not in self._listeners[group]:
+                self._listeners[group].append(callback)
+        self.listen()
+
+    def remove_listener(self, group, callback):
+        with self._lock:
+            if callback in self._listeners.get(group, ()):
+                self._listeners[group].remove(callback)
+                if not self._listeners[group]:
+                    del self._listeners[group]
+
+    def _receive(self, sock):
+        while self._socket is sock:
+            try:
+                data = sock.recv(CHANNEL_MESSAGE_MAX_SIZE)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            self.deliver(data)
+
+    def deliver(self, data):
+        try:
+            payload = json.loads(data)
+            group, message = payload['group'], payload['message']
+            if not isinstance(message, dict):
+                raise TypeError("Message is not a dict")
+            self.valid_group_name(group)
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning("Dropped a malformed group message: %s", e)
+            return
+        for callback in list(self._listeners.get(group, ())):
+            try:
+                callback(message)
+            except Exception:
+                logger.exception("Listener of group %s failed", group)
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._send_to_channels, group, message)
+
+    def _send_to_channels(self, group, message):
+        asyncio.ensure_future(InMemoryChannelLayer.group_send(self, group, message)).add_done_callback(
+            self._log_failure)
+
+    @staticmethod
+    def _log_failure(task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Could not deliver a group message", exc_info=task.exception())
+
+    def _attach(self):
+        # Group messages reach the channels of the loop the consumers run on
+        self._loop = asyncio.get_running_loop()
+        self.listen()
+
+    async def receive(self, channel):
+        self._attach()
+        return await super().receive(channel)
+
+    async def group_add(self, group, channel):
+        self._attach()
+        await super().group_add(group, channel)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "Message is not a dict"
+        assert self.valid_group_name(group), "Invalid group name"
+        self.broadcast(group, message)
+
+    def broadcast(self, group, message):
+        """
+        Send a group message to every worker of the deployment, callable from any thread
+        """
+        with self._lock:
+            self.check_directory()
+            if self._sender is None:
+                self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                self._sender.setblocking(False)
+            sender = self._sender
+        data = json.dumps({'group': group, 'message': message}).encode()
+        prefix = self.prefix + '-'
+        for name in os.listdir(self.socket_dir):
+            if not name.startswith(prefix) or not name.endswith('.sock'):
+                continue
+            path = os.path.join(self.socket_dir, name)
+            try:
+                sender.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # The worker bound to this socket is gone
+                self._unlink(path)
+            except BlockingIOError:
+                # The worker's receive buffer is full, drop the message as a full channel would
+                pass
+            except OSError:
+                logger.warning("Could not send a group message to %s", path, exc_info=True)
+
+    async def close(self):
+        with self._lock:
+            sock, self._socket = self._socket, None
+            sender, self._sender = self._sender, None
+            self._loop = None
+        if sock is not None:
+            sock.close()
+            self._unlink(self.socket_path)
+        if sender is not None:
+            sender.close()
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
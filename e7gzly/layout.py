@@ -0,0 +1,98 @@
+import re
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
+
+from .constants import SEAT_LAYOUTS_MAX_SIZE, VIP_ROWS_MAX, VIP_SEATS_PER_ROW_MAX
+from .utilities import number_to_row
+
+_SEAT_ID = re.compile(r'([A-Za-z]+)0*([0-9]+)')
+
+
+def normalize_seat_id(seat_id):
+    """
+    Canonical form of a seat id, upper case row letters followed by the seat number without leading zeros
+    """
+    match = _SEAT_ID.fullmatch(seat_id)
+    if match is None:
+        return seat_id.upper()
+    return match.group(1).upper() + match.group(2)
+
+
+class SeatLayout:
+    """
+    Precompiled layout of a VIP block: frozen tables from seat id to its index in row-major order and back, so that
+    seats are validated and located with lookups instead of parsing
+    """
+    __slots__ = ('rows', 'seats_per_row', 'seat_ids', 'indexes')
+
+    def __init__(self, rows, seats_per_row):
+        self.rows = rows
+        self.seats_per_row = seats_per_row
+        self.seat_ids = tuple('{}{}'.format(number_to_row(row), seat)
+                              for row in range(rows) for seat in range(seats_per_row))
+        self.indexes = MappingProxyType({seat_id: idx for idx, seat_id in enumerate(self.seat_ids)})
+
+    def __len__(self):
+        return len(self.seat_ids)
+
+    def index(self, seat_id):
+        idx = self.indexes.get(seat_id)
+        if idx is None:
+            idx = self.indexes.get(normalize_seat_id(seat_id))
+        return idx
+
+    def is_valid(self, seat_id):
+        return self.index(seat_id) is not None
+
+    def batch_indexes(self, seat_ids):
+        """
+        Indexes of a batch of seats, None if any of them is not part of the layout
+        """
+        indexes = []
+        for seat_id in seat_ids:
+            idx = self.index(seat_id)
+            if idx is None:
+                return None
+            indexes.append(idx)
+        return indexes
+
+    def position(self, idx):
+        """
+        (row, seat) of a seat index
+        """
+        return divmod(idx, self.seats_per_row)
+
+
+class SeatLayoutRegistry:
+    """
+    Bounded LRU of seat layouts shared by all the stadiums with the same VIP block dimensions
+    """
+
+    def __init__(self, max_size=SEAT_LAYOUTS_MAX_SIZE):
+        self.max_size = max_size
+        self._layouts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, rows, seats_per_row):
+        key = (rows, seats_per_row)
+        with self._lock:
+            layout = self._layouts.get(key)
+            if layout is not None:
+                self._layouts.move_to_end(key)
+                return layout
+        layout = SeatLayout(rows, seats_per_row)
+        with self._lock:
+            layout = self._layouts.setdefault(key, layout)
+            while len(self._layouts) > self.max_size:
+                self._layouts.popitem(last=False)
+        return layout
+
+    def largest(self):
+        """
+        Layout of the largest VIP block a stadium can have, every valid seat id of any stadium is part of it
+        """
+        return self.get(VIP_ROWS_MAX, VIP_SEATS_PER_ROW_MAX)
+
+
+seat_layouts = SeatLayoutRegistry()
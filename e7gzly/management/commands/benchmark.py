@@ -0,0 +1,76 @@
+import json
+import logging
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from e7gzly.benchmark import Benchmark, Fixture, compare
+
+SCENARIOS = ('login', 'matches', 'match_details', 'reserve', 'fanout')
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the hot endpoints against a throwaway fixture in the configured database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*',
+                            help='Scenarios to run, all of them by default: {}'.format(', '.join(SCENARIOS)))
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=16, help='Concurrent clients, one user each')
+        parser.add_argument('--consumers', type=int, default=50, help='Websocket consumers of the fanout scenario')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the seats picked by the reserve scenario')
+        parser.add_argument('--baseline', help='Results of a previous run to compare against')
+        parser.add_argument('--tolerance', type=float, default=10,
+                            help='Change, in percent, beyond which a metric counts as a regression')
+        parser.add_argument('--fail-on-regression', action='store_true', help='Exit with an error on a regression')
+        parser.add_argument('--save-baseline', help='Write the results to this file')
+        parser.add_argument('--throttle', action='store_true',
+                            help='Keep the per-user rate limits, which the clients would otherwise quickly exceed')
+
+    def handle(self, *args, **options):
+        unknown = set(options['scenarios']) - set(SCENARIOS)
+        if unknown:
+            raise CommandError("Unknown scenarios: {}".format(', '.join(sorted(unknown))))
+        scenarios = [scenario for scenario in SCENARIOS if not options['scenarios'] or scenario in options['scenarios']]
+        # Expected 4xx responses, such as reservation conflicts, and slow logins would otherwise be logged one by one
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        logging.getLogger('e7gzly.instrumentation').setLevel(logging.ERROR)
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)
+        throttling = nullcontext() if options['throttle'] else override_settings(
+            REST_FRAMEWORK=dict(settings.REST_FRAMEWORK, DEFAULT_THROTTLE_RATES={}))
+        results = {}
+        with throttling:
+            fixture = Fixture(options['concurrency'])
+            try:
+                benchmark = Benchmark(fixture, options['concurrency'], options['requests'], options['seed'])
+                for scenario in scenarios:
+                    if scenario in ('reserve', 'fanout') and not benchmark.tokens:
+                        benchmark.issue_tokens()
+                    if scenario == 'fanout':
+                        results[scenario] = benchmark.fanout(options['consumers'])
+                    else:
+                        results[scenario] = getattr(benchmark, scenario)()
+                    self.stdout.write("{:<14} {}".format(scenario, json.dumps(results[scenario])))
+            finally:
+                fixture.delete()
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as baseline_file:
+                json.dump(results, baseline_file, indent=2, sort_keys=True)
+        if baseline is None:
+            return
+        regressions = 0
+        for scenario, metric, previous, current, change, regressed in compare(results, baseline,
+                                                                               options['tolerance'] / 100):
+            line = "{:<14} {:<20} {:>10} -> {:<10} {:+.1f}%".format(scenario, metric, previous, current, change * 100)
+            if regressed:
+                regressions += 1
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
+        if regressions and options['fail_on_regression']:
+            raise CommandError("{} metrics regressed by more than {}%".format(regressions, options['tolerance']))
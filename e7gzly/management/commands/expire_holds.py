@@ -0,0 +1,60 @@
+import logging
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand, CommandError
+
+from e7gzly.constants import HOLDS_EXPIRY_BATCH_SIZE
+from e7gzly.repositories import repository
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Release expired seat holds in batches and publish the released seats to the seat map followers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=HOLDS_EXPIRY_BATCH_SIZE,
+                            help='Maximum number of holds released per write')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep sweeping every given number of seconds instead of sweeping once')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("Batch size should be positive")
+        channel_layer = get_channel_layer()
+        if options['interval'] <= 0:
+            self.report(self.sweep(channel_layer, options['batch_size']))
+            return
+        while True:
+            try:
+                self.report(self.sweep(channel_layer, options['batch_size']))
+            except Exception:
+                # A transient database or channel layer failure should not stop the sweeper, the holds it missed are
+                # released by the next sweep
+                logger.exception("Could not release expired holds")
+            time.sleep(options['interval'])
+
+    def report(self, released):
+        if released:
+            self.stdout.write("Released {} expired holds".format(released))
+
+    @staticmethod
+    def sweep(channel_layer, batch_size):
+        """
+        Release expired holds until none is left, returns the number of released holds
+        """
+        released = 0
+        while True:
+            batch = 0
+            for match_id, seat_ids, seq in repository.expire_holds(batch_size):
+                async_to_sync(channel_layer.group_send)(match_id, {
+                    "type": "update",
+                    "seq": seq,
+                    "released_seat_ids": seat_ids
+                })
+                batch += len(seat_ids)
+            released += batch
+            if batch < batch_size:
+                return released
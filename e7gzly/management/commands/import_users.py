@@ -0,0 +1,108 @@
+import csv
+import itertools
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from neomodel import UniqueProperty
+
+from e7gzly.constants import USERS_IMPORT_BATCH_SIZE
+from e7gzly.hashing import password_hasher
+from e7gzly.repositories import repository
+from e7gzly.serializers import UserBaseSerializer
+
+
+class Command(BaseCommand):
+    help = 'Import users from a CSV or NDJSON file, validating every row as a registration'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or NDJSON file, "-" to read from the standard input')
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help='Input format, guessed from the file extension by default')
+        parser.add_argument('--batch-size', type=int, default=USERS_IMPORT_BATCH_SIZE,
+                            help='Number of users written per query')
+        parser.add_argument('--authorize', action='store_true', help='Import the users as authorized')
+
+    def handle(self, *args, **options):
+        input_format = options['format'] or ('csv' if options['path'].lower().endswith('.csv') else 'ndjson')
+        input_file = sys.stdin if options['path'] == '-' else open(options['path'], newline='', encoding='utf-8')
+        started = time.monotonic()
+        imported = failed = 0
+        try:
+            rows = self.read_csv(input_file) if input_format == 'csv' else self.read_ndjson(input_file)
+            while True:
+                batch = list(itertools.islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                batch_imported, batch_failed = self.import_batch(batch, options['authorize'])
+                imported += batch_imported
+                failed += batch_failed
+                self.stdout.write("{} users imported, {} rows failed".format(imported, failed))
+        finally:
+            if input_file is not sys.stdin:
+                input_file.close()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS("Imported {} users in {:.1f}s ({:.0f} users/s), {} rows failed".format(
+            imported, elapsed, imported / elapsed if elapsed else 0, failed)))
+
+    @staticmethod
+    def read_csv(input_file):
+        for line_number, row in enumerate(csv.DictReader(input_file), start=2):
+            yield line_number, {key: value for key, value in row.items() if value != ''}
+
+    @staticmethod
+    def read_ndjson(input_file):
+        for line_number, line in enumerate(input_file, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                raise CommandError("Line {}: {}".format(line_number, e))
+            yield line_number, row
+
+    def import_batch(self, batch, authorize):
+        failed = 0
+        valid_rows = []
+        usernames = set()
+        emails = set()
+        for line_number, row in batch:
+            serializer = UserBaseSerializer(data=row)
+            if not serializer.is_valid():
+                self.report(line_number, serializer.errors)
+                failed += 1
+                continue
+            user_data = serializer.validated_data
+            if user_data['username'] in usernames or user_data['email'] in emails:
+                self.report(line_number, "Duplicate username or email within the input")
+                failed += 1
+                continue
+            usernames.add(user_data['username'])
+            emails.add(user_data['email'])
+            user_data['authorized'] = authorize
+            valid_rows.append((line_number, user_data))
+        if not valid_rows:
+            return 0, failed
+        passwords = password_hasher.make_passwords(user_data['password'] for _, user_data in valid_rows)
+        for (_, user_data), password in zip(valid_rows, passwords):
+            user_data['password'] = password
+        try:
+            created = set(repository.import_users([user_data for _, user_data in valid_rows]))
+        except UniqueProperty:
+            # Users conflicting with the batch were registered while it was being written, importing its rows one at a
+            # time skips only those
+            created = set()
+            for _, user_data in valid_rows:
+                try:
+                    created.update(repository.import_users([user_data]))
+                except UniqueProperty:
+                    pass
+        for line_number, user_data in valid_rows:
+            if user_data['username'] not in created:
+                self.report(line_number, "A user with the given username or email already exists")
+                failed += 1
+        return len(created), failed
+
+    def report(self, line_number, errors):
+        self.stderr.write("Row {}: {}".format(line_number, json.dumps(errors)))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from e7gzly.schema import SCHEMA, LABEL_SCANS, rule_name, install_schema, verify_schema, view_queries, explain, \
+    backfill_reservation_keys, missing_reservation_keys
+
+
+class Command(BaseCommand):
+    help = 'Backfill seat reservation keys, install and verify the indexes and constraints the views rely on, and ' \
+           'report queries that scan labels'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only verify, failing if a rule is missing or a query unexpectedly scans a label')
+        parser.add_argument('--no-explain', action='store_true', help='Skip the query plan report')
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            # Before the constraints, so that legacy seats fall under the reservation_key uniqueness constraint
+            backfilled = backfill_reservation_keys()
+            if backfilled:
+                self.stdout.write(" + Backfilled the reservation key of {} seats".format(backfilled))
+            for rule in install_schema():
+                self.stdout.write(" + Created {}".format(rule_name(rule)))
+        problems = verify_schema()
+        missing_keys = missing_reservation_keys()
+        if missing_keys:
+            self.stdout.write(self.style.WARNING(" ! {} seats have no reservation key".format(missing_keys)))
+        for rule, state in problems.items():
+            self.stdout.write(self.style.WARNING(" ! {} is {}".format(rule_name(rule), state or 'missing')))
+        if not problems:
+            self.stdout.write(self.style.SUCCESS("All {} indexes and constraints are online".format(len(SCHEMA))))
+        unexpected_scans = 0
+        if not options['no_explain']:
+            for view_query in view_queries():
+                scans = sorted({operator for operator in explain(view_query.query, view_query.params)
+                                if operator in LABEL_SCANS})
+                if not scans:
+                    self.stdout.write("   {:<36} index".format(view_query.view))
+                elif view_query.full_listing:
+                    self.stdout.write("   {:<36} {} (full listing)".format(view_query.view, ', '.join(scans)))
+                else:
+                    unexpected_scans += 1
+                    self.stdout.write(self.style.WARNING(" ! {:<36} {}".format(view_query.view, ', '.join(scans))))
+        if options['check'] and (problems or unexpected_scans or missing_keys):
+            raise CommandError("{} schema rules are not online, {} queries scan labels and {} seats have no "
+                               "reservation key".format(len(problems), unexpected_scans, missing_keys))
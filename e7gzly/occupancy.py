@@ -0,0 +1,233 @@
+import base64
+import functools
+import logging
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+
+from channels.layers import get_channel_layer
+
+from .constants import SEAT_MAPS_MAX_SIZE, SEAT_MAP_DELTAS_MAX_SIZE, SEAT_MAP_REVALIDATE_INTERVAL
+from .invalidation import invalidate, listen_for_invalidations, on_invalidation
+from .layers import UnixSocketChannelLayer
+from .layout import seat_layouts
+from .repositories import repository
+
+logger = logging.getLogger(__name__)
+
+Delta = namedtuple('Delta', ['seq', 'reserved', 'released'])
+
+
+def merge_deltas(deltas):
+    """
+    Net effect of consecutive deltas as lists of reserved and released seat ids
+    """
+    states = OrderedDict()
+    for delta in deltas:
+        for seat_id in delta.reserved:
+            states[seat_id] = True
+        for seat_id in delta.released:
+            states[seat_id] = False
+    return [seat_id for seat_id, reserved in states.items() if reserved], \
+           [seat_id for seat_id, reserved in states.items() if not reserved]
+
+
+class SeatMap:
+    """
+    Occupancy of a match venue's VIP block, one bit per seat in row-major order (most significant bit first), along
+    with the sequence number of the last applied change and a bounded history of the latest changes
+    """
+
+    def __init__(self, rows, seats_per_row, seat_ids=(), seq=0):
+        self.rows = rows
+        self.seats_per_row = seats_per_row
+        self.layout = seat_layouts.get(rows, seats_per_row)
+        self.bits = bytearray((len(self.layout) + 7) // 8)
+        for seat_id in seat_ids:
+            self.reserve(seat_id)
+        self.seq = seq
+        self.deltas = deque(maxlen=SEAT_MAP_DELTAS_MAX_SIZE)
+        self.waiting_deltas = {}
+        self.validated = time.monotonic()
+
+    def is_reserved(self, seat_id):
+        idx = self.layout.index(seat_id)
+        if idx is None:
+            return False
+        return bool(self.bits[idx >> 3] & (0x80 >> (idx & 7)))
+
+    def reserve(self, seat_id):
+        idx = self.layout.index(seat_id)
+        if idx is None:
+            logger.warning("Seat %r is not part of a %dx%d VIP block, it is left out of the seat map",
+                           seat_id, self.rows, self.seats_per_row)
+            return
+        self.bits[idx >> 3] |= 0x80 >> (idx & 7)
+
+    def release(self, seat_id):
+        idx = self.layout.index(seat_id)
+        if idx is None:
+            logger.warning("Seat %r is not part of a %dx%d VIP block, it is left out of the seat map",
+                           seat_id, self.rows, self.seats_per_row)
+            return
+        self.bits[idx >> 3] &= ~(0x80 >> (idx & 7)) & 0xFF
+
+    def apply(self, delta):
+        """
+        Apply a change once all the changes before it are applied, returns False if too many changes are waiting for
+        missing ones
+        """
+        if delta.seq <= self.seq:
+            return True
+        self.waiting_deltas[delta.seq] = delta
+        while self.seq + 1 in self.waiting_deltas:
+            delta = self.waiting_deltas.pop(self.seq + 1)
+            for seat_id in delta.reserved:
+                self.reserve(seat_id)
+            for seat_id in delta.released:
+                self.release(seat_id)
+            self.seq = delta.seq
+            self.deltas.append(delta)
+        return len(self.waiting_deltas) <= SEAT_MAP_DELTAS_MAX_SIZE
+
+    def deltas_since(self, seq):
+        if seq == self.seq:
+            return []
+        if seq > self.seq or not self.deltas or self.deltas[0].seq > seq + 1:
+            return None
+        return [delta for delta in self.deltas if delta.seq > seq]
+
+    def pack(self):
+        return base64.b64encode(bytes(self.bits)).decode()
+
+
+class SeatMapRegistry:
+    """
+    Bounded LRU of seat maps per match, kept up to date by applying in place the changes every worker broadcasts to
+    the match group. A seat map is reloaded from the repository when a change is missing, or when the match sequence
+    number, checked every SEAT_MAP_REVALIDATE_INTERVAL seconds, shows that the latest changes never arrived
+    """
+
+    def __init__(self, max_size=SEAT_MAPS_MAX_SIZE):
+        self.max_size = max_size
+        self._seat_maps = OrderedDict()
+        self._listeners = {}
+        self._lock = threading.Lock()
+
+    def get(self, match_id):
+        with self._lock:
+            seat_map = self._seat_maps.get(match_id)
+            if seat_map is None or seat_map.waiting_deltas:
+                seat_map = None
+            else:
+                self._seat_maps.move_to_end(match_id)
+                # Without the match group, changes made by other workers only show in the match sequence number
+                validated = match_id in self._listeners and \
+                    time.monotonic() - seat_map.validated < SEAT_MAP_REVALIDATE_INTERVAL
+        if seat_map is None:
+            return self.load(match_id)
+        if not validated:
+            if repository.match_seq(match_id) != seat_map.seq:
+                return self.load(match_id)
+            seat_map.validated = time.monotonic()
+        return seat_map
+
+    def load(self, match_id):
+        """
+        Reload the seat map of a match, following the changes of the match group from then on
+        """
+        listen_for_invalidations()
+        self.follow(match_id)
+        state = repository.seat_map(match_id)
+        if state is None:
+            self.discard(match_id)
+            return None
+        seq, rows, seats_per_row, seat_ids = state
+        seat_map = SeatMap(rows, seats_per_row, seat_ids, seq)
+        with self._lock:
+            previous = self._seat_maps.get(match_id)
+            if previous is not None:
+                # Changes that arrived ahead of the missing one may be newer than the reloaded state
+                for delta in sorted(previous.waiting_deltas.values()):
+                    seat_map.apply(delta)
+            self._seat_maps[match_id] = seat_map
+            while len(self._seat_maps) > self.max_size:
+                evicted, _ = self._seat_maps.popitem(last=False)
+                self.unfollow(evicted)
+        return seat_map
+
+    def follow(self, match_id):
+        channel_layer = get_channel_layer()
+        if not isinstance(channel_layer, UnixSocketChannelLayer):
+            return
+        with self._lock:
+            listener = self._listeners.setdefault(match_id, functools.partial(self.receive, match_id))
+        channel_layer.add_listener(match_id, listener)
+
+    def unfollow(self, match_id):
+        listener = self._listeners.pop(match_id, None)
+        if listener is not None:
+            get_channel_layer().remove_listener(match_id, listener)
+
+    def receive(self, match_id, message):
+        if message.get('type') == 'update':
+            self.apply(match_id, Delta(message['seq'], message.get('seat_ids', []),
+                                       message.get('released_seat_ids', [])))
+
+    def is_reserved(self, match_id, seat_id):
+        seat_map = self.get(match_id)
+        with self._lock:
+            return seat_map.is_reserved(seat_id)
+
+    def snapshot(self, match_id):
+        seat_map = self.get(match_id)
+        if seat_map is None:
+            return None
+        with self._lock:
+            return {
+                'seq': seat_map.seq,
+                'rows': seat_map.rows,
+                'seats_per_row': seat_map.seats_per_row,
+                'seats': seat_map.pack()
+            }
+
+    def deltas_since(self, match_id, seq):
+        """
+        Changes of a match after the given sequence number as (current sequence number, deltas), or None if they are
+        no longer retained
+        """
+        seat_map = self.get(match_id)
+        if seat_map is None:
+            return None
+        with self._lock:
+            deltas = seat_map.deltas_since(seq)
+            if deltas is None:
+                return None
+            return seat_map.seq, deltas
+
+    def apply(self, match_id, delta):
+        with self._lock:
+            seat_map = self._seat_maps.get(match_id)
+            if seat_map is not None and not seat_map.apply(delta):
+                del self._seat_maps[match_id]
+                self.unfollow(match_id)
+
+    def discard(self, match_id):
+        with self._lock:
+            self._seat_maps.pop(match_id, None)
+            self.unfollow(match_id)
+
+
+seat_maps = SeatMapRegistry()
+
+
+@on_invalidation('seat_map')
+def _discard_seat_map(match_id):
+    seat_maps.discard(match_id)
+
+
+def invalidate_seat_map(match_id):
+    """
+    Drop the seat map of a match in every worker process of the host, once its venue changed
+    """
+    invalidate('seat_map', match_id)
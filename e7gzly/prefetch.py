@@ -0,0 +1,46 @@
+from collections import defaultdict
+
+from neomodel import db
+from neomodel.match import _rel_helper
+
+
+def prefetch_related(nodes, *relations):
+    """
+    Resolve the given relationships of a batch of nodes of the same class, one query per relationship
+    """
+    nodes = list(nodes)
+    if not nodes:
+        return nodes
+    node_class = type(nodes[0])
+    ids = [node.id for node in nodes]
+    for relation in relations:
+        definition = getattr(node_class, relation)
+        definition._lookup_node_class()
+        related_class = definition.definition['node_class']
+        pattern = _rel_helper(lhs='node', rhs='related:{}'.format(related_class.__label__),
+                              relation_type=definition.definition['relation_type'],
+                              direction=definition.definition['direction'])
+        results, _ = db.cypher_query("MATCH {} WHERE id(node) IN $ids RETURN id(node), related".format(pattern),
+                                     {'ids': ids})
+        related = defaultdict(list)
+        for node_id, related_node in results:
+            related[node_id].append(related_class.inflate(related_node))
+        for node in nodes:
+            set_related(node, relation, related[node.id])
+    return nodes
+
+
+def set_related(node, relation, related_nodes):
+    node.__dict__.setdefault('_prefetched', {})[relation] = related_nodes
+
+
+def get_related(node, relation):
+    prefetched = node.__dict__.get('_prefetched', {})
+    if relation in prefetched:
+        return prefetched[relation]
+    return getattr(node, relation).all()
+
+
+def get_single_related(node, relation):
+    related = get_related(node, relation)
+    return related[0] if related else None
@@ -0,0 +1,213 @@
+RESERVE_SEATS = """
+MATCH (match:Match {match_id: $match_id})-[:HOSTED_IN]->(stadium:Stadium)
+MATCH (user:User) WHERE id(user) = $user_id
+// The match is locked before its holds are read, so that neither the holds sweeper nor a confirmation, which lock
+// it as well, changes one of them in between
+SET match._lock = true
+REMOVE match._lock
+WITH match, user, match.admission_rate IS NULL OR $admitted AS admitted,
+     all(requested IN $seats WHERE requested.row < stadium.vip_rows
+                               AND requested.seat < stadium.vip_seats_per_row) AS valid
+WITH match, user, admitted, admitted AND valid AS valid
+// Expired holds that were not swept yet do not block the seats
+OPTIONAL MATCH (expired:Seat)
+WHERE valid AND expired.reservation_key IN [requested IN $seats | requested.reservation_key]
+  AND expired.held_until < $now
+DETACH DELETE expired
+WITH DISTINCT match, user, admitted, valid
+FOREACH (requested IN CASE WHEN valid THEN $seats ELSE [] END |
+    CREATE (user)-[:RESERVED_A]->(:Seat {ticket_id: requested.ticket_id, seat_id: requested.seat_id,
+                                         reservation_key: requested.reservation_key,
+                                         held_until: $held_until})-[:FOR]->(match))
+FOREACH (_ IN CASE WHEN valid THEN [1] ELSE [] END | SET match.seq = coalesce(match.seq, 0) + 1)
+WITH match, user, admitted, valid
+OPTIONAL MATCH (user)-[:RESERVED_A]->(seat:Seat)
+WHERE seat.ticket_id IN [requested IN $seats | requested.ticket_id]
+RETURN admitted, valid, collect(seat), match.seq
+"""
+
+SEAT_MAP = """
+MATCH (match:Match {match_id: $match_id})-[:HOSTED_IN]->(stadium:Stadium)
+OPTIONAL MATCH (match)<-[:FOR]-(seat:Seat)
+RETURN coalesce(match.seq, 0), stadium.vip_rows, stadium.vip_seats_per_row, collect(seat.seat_id)
+"""
+
+MATCH_SEQ = """
+MATCH (match:Match {match_id: $match_id})
+RETURN coalesce(match.seq, 0)
+"""
+
+TOKEN_USER = """
+MATCH (token:Token {key: $key})
+OPTIONAL MATCH (user:User)-[:BEARS_A]->(token)
+RETURN token, user
+"""
+
+UPCOMING_MATCHES_AFTER = """
+MATCH (match:Match)
+WHERE match.date >= $now AND (match.date > $date OR (match.date = $date AND match.match_id > $match_id))
+WITH match
+ORDER BY match.date, match.match_id
+LIMIT $limit
+MATCH (match)-[:HOSTED_IN]->(stadium:Stadium)
+RETURN match, stadium
+ORDER BY match.date, match.match_id
+"""
+
+MATCH_DETAILS = """
+MATCH (match:Match {match_id: $match_id})-[:HOSTED_IN]->(stadium:Stadium)
+RETURN match, stadium
+"""
+
+MATCH_DETAILS_WITH_SEATS = """
+MATCH (match:Match {match_id: $match_id})-[:HOSTED_IN]->(stadium:Stadium)
+OPTIONAL MATCH (match)<-[:FOR]-(seat:Seat)
+RETURN match, stadium, collect(seat {.ticket_id, .seat_id})
+"""
+
+USER_RESERVATIONS = """
+MATCH (user:User)-[:RESERVED_A]->(seat:Seat)-[:FOR]->(match:Match)-[:HOSTED_IN]->(stadium:Stadium)
+WHERE id(user) = $user_id AND match.date >= $since AND seat.held_until IS NULL
+RETURN seat, match, stadium
+ORDER BY match.date, seat.seat_id
+"""
+
+CANCEL_RESERVATION = """
+MATCH (user:User)-[:RESERVED_A]->(seat:Seat {ticket_id: $ticket_id})-[:FOR]->(match:Match)
+WHERE id(user) = $user_id AND seat.held_until IS NULL
+WITH seat, match, seat.seat_id AS seat_id, match.date >= $deadline AS cancellable
+FOREACH (_ IN CASE WHEN cancellable THEN [1] ELSE [] END |
+    DETACH DELETE seat
+    SET match.seq = coalesce(match.seq, 0) + 1)
+RETURN cancellable, match.match_id, seat_id, match.seq
+"""
+
+CONFIRM_HOLDS = """
+MATCH (user:User) WHERE id(user) = $user_id
+OPTIONAL MATCH (user)-[:RESERVED_A]->(held:Seat)-[:FOR]->(match:Match)
+WHERE held.ticket_id IN $ticket_ids AND held.held_until IS NOT NULL
+// Lock the matches as the holds sweeper does, then match the holds again as it may have deleted some of them
+WITH user, collect(DISTINCT match) AS matches
+FOREACH (match IN matches | SET match._lock = true REMOVE match._lock)
+WITH user
+OPTIONAL MATCH (user)-[:RESERVED_A]->(seat:Seat)
+WHERE seat.ticket_id IN $ticket_ids AND seat.held_until IS NOT NULL
+WITH collect(seat) AS seats
+WITH seats, size(seats) = size($ticket_ids) AND all(seat IN seats WHERE seat.held_until >= $now) AS valid
+FOREACH (seat IN CASE WHEN valid THEN seats ELSE [] END | REMOVE seat.held_until)
+RETURN valid, seats
+"""
+
+EXPIRE_HOLDS = """
+MATCH (expired:Seat)
+WHERE expired.held_until < $now
+WITH expired
+LIMIT $limit
+MATCH (expired)-[:FOR]->(match:Match)
+WITH match, collect(expired.ticket_id) AS ticket_ids
+// Lock the match as reservations and confirmations do, then match the holds again as they may have deleted or
+// confirmed some of them since they were read
+SET match._lock = true
+REMOVE match._lock
+WITH match, ticket_ids
+MATCH (seat:Seat)-[:FOR]->(match)
+WHERE seat.ticket_id IN ticket_ids AND seat.held_until IS NOT NULL AND seat.held_until < $now
+WITH match, collect(seat) AS seats
+WITH match, seats, [seat IN seats | seat.seat_id] AS seat_ids
+FOREACH (seat IN seats | DETACH DELETE seat)
+SET match.seq = coalesce(match.seq, 0) + 1
+RETURN match.match_id, seat_ids, match.seq
+"""
+
+ROTATE_TOKEN = """
+MATCH (user:User) WHERE id(user) = $user_id AND user.password = $password
+// Lock the user, then check the password again as a password change may have committed since it was matched
+SET user._lock = true
+REMOVE user._lock
+WITH user
+WHERE user.password = $password
+SET user.password = $new_password, user.last_login = $now
+WITH user
+OPTIONAL MATCH (user)-[:BEARS_A]->(old:Token)
+WITH user, collect(old) AS old_tokens
+WITH user, old_tokens, [old IN old_tokens | old.key] AS old_keys
+FOREACH (old IN old_tokens | DETACH DELETE old)
+CREATE (user)-[:BEARS_A]->(token:Token $token)
+RETURN token, old_keys
+"""
+
+REGISTER_USER = """
+CREATE (user:User $user)-[:BEARS_A]->(token:Token $token)
+RETURN user, token
+"""
+
+IMPORT_USERS = """
+UNWIND $users AS properties
+OPTIONAL MATCH (by_username:User {username: properties.username})
+OPTIONAL MATCH (by_email:User {email: properties.email})
+WITH properties, by_username, by_email
+WHERE by_username IS NULL AND by_email IS NULL
+CREATE (user:User)
+SET user = properties
+RETURN user.username
+"""
+
+AUTHORIZE_USERS = """
+UNWIND $usernames AS username
+OPTIONAL MATCH (user:User {username: username})
+FOREACH (_ IN CASE WHEN user IS NULL THEN [] ELSE [1] END | SET user.authorized = true)
+WITH username, user
+OPTIONAL MATCH (user)-[:BEARS_A]->(token:Token)
+RETURN username, user IS NOT NULL, collect(token.key)
+"""
+
+AUTHORIZE_MATCHING_USERS = """
+MATCH (user:User)
+WHERE user.authorized = false AND user.role <> 'admin'
+  AND ($role IS NULL OR user.role = $role)
+  AND ($registered_before IS NULL OR user.registered < $registered_before)
+SET user.authorized = true
+WITH user
+OPTIONAL MATCH (user)-[:BEARS_A]->(token:Token)
+RETURN user.username, true, collect(token.key)
+ORDER BY user.username
+"""
+
+SCHEMA_INDEXES = """
+CALL db.indexes() YIELD labelsOrTypes, properties, uniqueness, state, entityType
+WHERE entityType = 'NODE' AND size(labelsOrTypes) = 1
+RETURN labelsOrTypes[0], properties, uniqueness = 'UNIQUE', state
+"""
+
+# Seats reserved before reservation_key existed escape its uniqueness constraint until they get one
+BACKFILL_RESERVATION_KEYS = """
+MATCH (seat:Seat)-[:FOR]->(match:Match)
+WHERE seat.reservation_key IS NULL
+WITH seat, match
+LIMIT $limit
+SET seat.reservation_key = match.match_id + ':' + seat.seat_id
+RETURN count(seat)
+"""
+
+MISSING_RESERVATION_KEYS = """
+MATCH (seat:Seat)
+WHERE seat.reservation_key IS NULL
+RETURN count(seat)
+"""
+
+DELETE_STADIUM_MATCHES = """
+MATCH (stadium:Stadium {stadium_id: $stadium_id})
+OPTIONAL MATCH (stadium)<-[:HOSTED_IN]-(match:Match)
+OPTIONAL MATCH (match)<-[:FOR]-(seat:Seat)
+WITH stadium, collect(DISTINCT match) AS matches, collect(seat) AS seats
+FOREACH (seat IN seats | DETACH DELETE seat)
+FOREACH (match IN matches | DETACH DELETE match)
+DETACH DELETE stadium
+"""
+
+DELETE_USERS = """
+UNWIND $usernames AS username
+MATCH (user:User {username: username})
+OPTIONAL MATCH (user)-[:BEARS_A]->(token:Token)
+DETACH DELETE token, user
+"""
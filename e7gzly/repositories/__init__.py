@@ -0,0 +1,6 @@
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+from django.utils.module_loading import import_string
+
+# Instantiated on first use, the backends import the models which import modules that depend on this one
+repository = SimpleLazyObject(lambda: import_string(settings.REPOSITORY_BACKEND)())
@@ -0,0 +1,177 @@
+from abc import ABC, abstractmethod
+
+
+class Repository(ABC):
+    """
+    Data access used by the views and the authentication backend. Lookups return None when nothing matches, and
+    writes raise neomodel's UniqueProperty on uniqueness violations. Related nodes needed by the serializers are
+    attached with set_related so that serializing never goes back to the backend
+    """
+
+    # Users and tokens
+
+    @abstractmethod
+    def get_user(self, username):
+        pass
+
+    @abstractmethod
+    def users(self, unauthorized=False):
+        """
+        Non-admin users ordered by first and last name as a sliceable sequence with a length
+        """
+
+    @abstractmethod
+    def register_user(self, properties):
+        """
+        Create a user along with its token, returns (user, token)
+        """
+
+    @abstractmethod
+    def import_users(self, batch):
+        """
+        See User.import_batch
+        """
+
+    @abstractmethod
+    def save_user(self, user):
+        pass
+
+    @abstractmethod
+    def delete_user(self, user):
+        """
+        Delete a user along with its token
+        """
+
+    @abstractmethod
+    def authorize_usernames(self, usernames):
+        """
+        See User.authorize_usernames
+        """
+
+    @abstractmethod
+    def authorize_matching(self, role=None, registered_before=None):
+        """
+        See User.authorize_matching
+        """
+
+    @abstractmethod
+    def rotate_token(self, user, new_password=None):
+        """
+        See User.rotate_token
+        """
+
+    @abstractmethod
+    def token_key(self, user):
+        pass
+
+    @abstractmethod
+    def token_user(self, key):
+        """
+        Returns (user, token) for the given token key, user being None if it was deleted, or None if there is no such
+        token
+        """
+
+    # Stadiums
+
+    @abstractmethod
+    def stadiums(self):
+        pass
+
+    @abstractmethod
+    def get_stadium(self, stadium_id):
+        pass
+
+    @abstractmethod
+    def create_stadium(self, properties):
+        """
+        Create a stadium and compile its seat layout, raises UniqueProperty if the name is taken
+        """
+
+    @abstractmethod
+    def delete_stadium(self, stadium):
+        """
+        Delete a stadium along with its matches and their reservations
+        """
+
+    # Matches
+
+    @abstractmethod
+    def upcoming_matches(self):
+        """
+        Upcoming matches ordered by date as a sliceable sequence with a length, see with_venues
+        """
+
+    @abstractmethod
+    def with_venues(self, matches):
+        """
+        Attach the venues to matches returned by upcoming_matches
+        """
+
+    @abstractmethod
+    def upcoming_matches_after(self, date, match_id, limit):
+        """
+        Upcoming matches with their venues ordered after the given (date timestamp, match_id) position
+        """
+
+    @abstractmethod
+    def match_details(self, match_id, with_seats=True):
+        """
+        A match with its venue and, optionally, the ticket_id/seat_id of its reserved seats
+        """
+
+    @abstractmethod
+    def get_match(self, match_id):
+        pass
+
+    @abstractmethod
+    def create_match(self, properties, stadium):
+        pass
+
+    @abstractmethod
+    def update_match(self, match, properties, stadium):
+        pass
+
+    @abstractmethod
+    def match_seq(self, match_id):
+        """
+        The sequence number of the reservation changes of a match, None if there is no such match
+        """
+
+    @abstractmethod
+    def seat_map(self, match_id):
+        """
+        (sequence number, rows, seats per row, reserved seat ids) of a match, None if there is no such match
+        """
+
+    # Reservations
+
+    @abstractmethod
+    def reserve_seats(self, user, match_id, seat_ids, held_until=None, admitted=False):
+        """
+        See Seat.reserve
+        """
+
+    @abstractmethod
+    def tickets(self, user, upcoming=False):
+        """
+        The user's reserved seats (holds excluded) along with their matches and venues, ordered by match date and
+        seat_id
+        """
+
+    @abstractmethod
+    def cancel_reservation(self, user, ticket_id, deadline):
+        """
+        See Seat.cancel
+        """
+
+    @abstractmethod
+    def confirm_holds(self, user, ticket_ids):
+        """
+        See Seat.confirm_holds
+        """
+
+    @abstractmethod
+    def expire_holds(self, limit):
+        """
+        See Seat.expire_holds
+        """
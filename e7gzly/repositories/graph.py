@@ -0,0 +1,123 @@
+from django.utils import timezone
+from neomodel import db
+
+from ..layout import seat_layouts
+from ..models import Match, Seat, Stadium, User, Token
+from ..prefetch import prefetch_related, set_related
+from ..queries import TOKEN_USER, SEAT_MAP, MATCH_SEQ, DELETE_STADIUM_MATCHES, DELETE_USERS
+from .base import Repository
+
+
+class Neo4jRepository(Repository):
+    """
+    Repository backed by the Neo4j graph through neomodel
+    """
+
+    def get_user(self, username):
+        return User.nodes.get_or_none(username=username)
+
+    def users(self, unauthorized=False):
+        users = User.nodes.order_by('first_name', 'last_name')
+        if unauthorized:
+            return users.filter(authorized=False, role__ne='admin')
+        return users.filter(role__ne='admin')
+
+    def register_user(self, properties):
+        return User.register(properties)
+
+    def import_users(self, batch):
+        return User.import_batch(batch)
+
+    def save_user(self, user):
+        user.save()
+
+    def delete_user(self, user):
+        db.cypher_query(DELETE_USERS, {'usernames': [user.username]})
+
+    def authorize_usernames(self, usernames):
+        return User.authorize_usernames(usernames)
+
+    def authorize_matching(self, role=None, registered_before=None):
+        return User.authorize_matching(role, registered_before)
+
+    def rotate_token(self, user, new_password=None):
+        return user.rotate_token(new_password)
+
+    def token_key(self, user):
+        token = user.token.single()
+        return None if token is None else token.key
+
+    def token_user(self, key):
+        results, _ = db.cypher_query(TOKEN_USER, {'key': key})
+        if not results:
+            return None
+        token, user = results[0]
+        return (None if user is None else User.inflate(user)), Token.inflate(token)
+
+    def stadiums(self):
+        return Stadium.nodes.all()
+
+    def get_stadium(self, stadium_id):
+        return Stadium.nodes.get_or_none(stadium_id=stadium_id)
+
+    def create_stadium(self, properties):
+        stadium = Stadium.create(properties)[0]
+        seat_layouts.get(stadium.vip_rows, stadium.vip_seats_per_row)
+        set_related(stadium, 'matches', [])
+        return stadium
+
+    def delete_stadium(self, stadium):
+        db.cypher_query(DELETE_STADIUM_MATCHES, {'stadium_id': stadium.stadium_id})
+
+    def upcoming_matches(self):
+        return Match.nodes.filter(date__gte=timezone.now()).order_by('date')
+
+    def with_venues(self, matches):
+        return prefetch_related(matches, 'match_venue')
+
+    def upcoming_matches_after(self, date, match_id, limit):
+        return Match.upcoming_after(date, match_id, limit)
+
+    def match_details(self, match_id, with_seats=True):
+        return Match.details(match_id, with_seats)
+
+    def get_match(self, match_id):
+        return Match.nodes.get_or_none(match_id=match_id)
+
+    def create_match(self, properties, stadium):
+        match = Match.create(properties)[0]
+        match.match_venue.connect(stadium)
+        set_related(match, 'match_venue', [stadium])
+        set_related(match, 'seats', [])
+        return match
+
+    def update_match(self, match, properties, stadium):
+        for name, value in properties.items():
+            setattr(match, name, value)
+        match.save()
+        match.match_venue.reconnect(match.match_venue.single(), stadium)
+        set_related(match, 'match_venue', [stadium])
+        return match
+
+    def match_seq(self, match_id):
+        results, _ = db.cypher_query(MATCH_SEQ, {'match_id': match_id})
+        return results[0][0] if results else None
+
+    def seat_map(self, match_id):
+        results, _ = db.cypher_query(SEAT_MAP, {'match_id': match_id})
+        return tuple(results[0]) if results else None
+
+    def reserve_seats(self, user, match_id, seat_ids, held_until=None, admitted=False):
+        return Seat.reserve(user, match_id, seat_ids, held_until, admitted)
+
+    def tickets(self, user, upcoming=False):
+        return user.tickets(upcoming)
+
+    def cancel_reservation(self, user, ticket_id, deadline):
+        return Seat.cancel(user, ticket_id, deadline)
+
+    def confirm_holds(self, user, ticket_ids):
+        return Seat.confirm_holds(user, ticket_ids)
+
+    def expire_holds(self, limit):
+        return Seat.expire_holds(limit)
@@ -0,0 +1,423 @@
+import bisect
+import heapq
+import itertools
+import threading
+import uuid
+from collections import defaultdict
+
+from django.utils import timezone
+from neomodel import UniqueProperty
+
+from ..admission import AdmissionRequired
+from ..layout import seat_layouts
+from ..models import Cancellation, Match, Seat, Stadium, Token, User
+from ..prefetch import set_related, get_single_related
+from .base import Repository
+
+
+class NodeSequence:
+    """
+    Sliceable sequence that only builds the nodes of the slices taken from it, for the paginator
+    """
+
+    def __init__(self, keys, build):
+        self.keys = keys
+        self.build = build
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.build(key) for key in self.keys[index]]
+        return self.build(self.keys[index])
+
+
+def _properties(node):
+    return {name: getattr(node, name, None) for name in type(node).defined_properties(aliases=False, rels=False)}
+
+
+class InMemoryRepository(Repository):
+    """
+    Repository holding every node in indexed dicts of the serving process, for exercising and profiling the API
+    without a database. Data is neither persisted nor shared between worker processes
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._ids = itertools.count(1)
+        # username -> (node id, properties)
+        self._users = {}
+        self._usernames_by_email = {}
+        # key -> (node id, properties, username)
+        self._tokens = {}
+        self._token_keys = {}
+        # stadium_id -> (node id, properties)
+        self._stadiums = {}
+        self._stadium_ids_by_name = {}
+        # match_id -> (node id, properties)
+        self._matches = {}
+        self._match_venues = {}
+        # (date timestamp, match_id) of every match, in order
+        self._match_order = []
+        # ticket_id -> (node id, properties, username, match_id)
+        self._seats = {}
+        self._tickets_by_reservation_key = {}
+        self._tickets_by_user = defaultdict(set)
+        self._tickets_by_match = defaultdict(dict)
+        # (held_until, ticket_id) of every hold, entries of confirmed or deleted holds are skipped when popped
+        self._holds = []
+
+    # Node builders, called with the lock held
+
+    @staticmethod
+    def _node(node_class, node_id, properties):
+        node = node_class(**properties)
+        node.id = node_id
+        return node
+
+    def _user(self, username):
+        record = self._users.get(username)
+        return None if record is None else self._node(User, *record)
+
+    def _token(self, key):
+        node_id, properties, _ = self._tokens[key]
+        return self._node(Token, node_id, properties)
+
+    def _stadium(self, stadium_id):
+        record = self._stadiums.get(stadium_id)
+        return None if record is None else self._node(Stadium, *record)
+
+    def _match(self, match_id):
+        record = self._matches.get(match_id)
+        if record is None:
+            return None
+        match = self._node(Match, *record)
+        set_related(match, 'match_venue', [self._stadium(self._match_venues[match_id])])
+        return match
+
+    def _seat(self, ticket_id):
+        node_id, properties, _, match_id = self._seats[ticket_id]
+        seat = self._node(Seat, node_id, properties)
+        set_related(seat, 'match', [self._match(match_id)])
+        return seat
+
+    def _order_key(self, match_id):
+        return Match.date.deflate(self._matches[match_id][1]['date']), match_id
+
+    # Users and tokens
+
+    def get_user(self, username):
+        with self._lock:
+            return self._user(username)
+
+    def users(self, unauthorized=False):
+        with self._lock:
+            users = sorted((properties['first_name'], properties['last_name'], username)
+                           for username, (_, properties) in self._users.items()
+                           if properties['role'] != 'admin' and not (unauthorized and properties['authorized']))
+        return NodeSequence([username for _, _, username in users], self.get_user)
+
+    def _create_user(self, properties):
+        properties = _properties(User(**properties))
+        if properties['username'] in self._users:
+            raise UniqueProperty("User with property `username` = '{}' already exists".format(properties['username']))
+        if properties['email'] in self._usernames_by_email:
+            raise UniqueProperty("User with property `email` = '{}' already exists".format(properties['email']))
+        self._users[properties['username']] = (next(self._ids), properties)
+        self._usernames_by_email[properties['email']] = properties['username']
+        return properties['username']
+
+    def _create_token(self, username):
+        properties = _properties(Token())
+        self._tokens[properties['key']] = (next(self._ids), properties, username)
+        self._token_keys[username] = properties['key']
+        return properties['key']
+
+    def _delete_token(self, username):
+        key = self._token_keys.pop(username, None)
+        if key is not None:
+            del self._tokens[key]
+        return key
+
+    def register_user(self, properties):
+        with self._lock:
+            username = self._create_user(properties)
+            return self._user(username), self._token(self._create_token(username))
+
+    def import_users(self, batch):
+        created = set()
+        with self._lock:
+            for properties in batch:
+                try:
+                    created.add(self._create_user(properties))
+                except UniqueProperty:
+                    continue
+        return created
+
+    def save_user(self, user):
+        with self._lock:
+            node_id, properties = self._users[user.username]
+            del self._usernames_by_email[properties['email']]
+            self._users[user.username] = (node_id, _properties(user))
+            self._usernames_by_email[user.email] = user.username
+
+    def delete_user(self, user):
+        with self._lock:
+            _, properties = self._users.pop(user.username)
+            del self._usernames_by_email[properties['email']]
+            self._delete_token(user.username)
+            # Like DETACH DELETE, the reservations of the user are kept
+            self._tickets_by_user.pop(user.username, None)
+
+    def authorize_usernames(self, usernames):
+        results = []
+        with self._lock:
+            for username in usernames:
+                record = self._users.get(username)
+                if record is not None:
+                    record[1]['authorized'] = True
+                key = self._token_keys.get(username)
+                results.append([username, record is not None, [key] if key is not None else []])
+        return results
+
+    def authorize_matching(self, role=None, registered_before=None):
+        results = []
+        with self._lock:
+            for username in sorted(self._users):
+                properties = self._users[username][1]
+                if properties['authorized'] or properties['role'] == 'admin':
+                    continue
+                if role is not None and properties['role'] != role:
+                    continue
+                if registered_before is not None and (properties['registered'] is None
+                                                      or properties['registered'] >= registered_before):
+                    continue
+                properties['authorized'] = True
+                key = self._token_keys.get(username)
+                results.append([username, True, [key] if key is not None else []])
+        return results
+
+    def rotate_token(self, user, new_password=None):
+        with self._lock:
+            record = self._users.get(user.username)
+            if record is None or record[1]['password'] != user.password:
+                return None, []
+            record[1]['password'] = new_password or user.password
+            record[1]['last_login'] = timezone.now()
+            old_key = self._delete_token(user.username)
+            token = self._token(self._create_token(user.username))
+        return token, [old_key] if old_key is not None else []
+
+    def token_key(self, user):
+        with self._lock:
+            return self._token_keys.get(user.username)
+
+    def token_user(self, key):
+        with self._lock:
+            if key not in self._tokens:
+                return None
+            return self._user(self._tokens[key][2]), self._token(key)
+
+    # Stadiums
+
+    def stadiums(self):
+        with self._lock:
+            return [self._stadium(stadium_id) for stadium_id in self._stadiums]
+
+    def get_stadium(self, stadium_id):
+        with self._lock:
+            return self._stadium(stadium_id)
+
+    def create_stadium(self, properties):
+        properties = _properties(Stadium(**properties))
+        seat_layouts.get(properties['vip_rows'], properties['vip_seats_per_row'])
+        with self._lock:
+            if properties['name'] in self._stadium_ids_by_name:
+                raise UniqueProperty("Stadium with property `name` = '{}' already exists".format(properties['name']))
+            self._stadiums[properties['stadium_id']] = (next(self._ids), properties)
+            self._stadium_ids_by_name[properties['name']] = properties['stadium_id']
+            stadium = self._stadium(properties['stadium_id'])
+        set_related(stadium, 'matches', [])
+        return stadium
+
+    def delete_stadium(self, stadium):
+        with self._lock:
+            for match_id in [match_id for match_id, stadium_id in self._match_venues.items()
+                             if stadium_id == stadium.stadium_id]:
+                for ticket_id in self._tickets_by_match.pop(match_id, {}):
+                    self._delete_seat(ticket_id)
+                self._match_order.remove(self._order_key(match_id))
+                del self._matches[match_id]
+                del self._match_venues[match_id]
+            _, properties = self._stadiums.pop(stadium.stadium_id)
+            del self._stadium_ids_by_name[properties['name']]
+
+    # Matches
+
+    def upcoming_matches(self):
+        with self._lock:
+            start = bisect.bisect_left(self._match_order, (Match.date.deflate(timezone.now()), ''))
+            match_ids = [match_id for _, match_id in self._match_order[start:]]
+        return NodeSequence(match_ids, self.get_match)
+
+    def with_venues(self, matches):
+        return list(matches)
+
+    def upcoming_matches_after(self, date, match_id, limit):
+        with self._lock:
+            start = max(bisect.bisect_right(self._match_order, (date, match_id)),
+                        bisect.bisect_left(self._match_order, (Match.date.deflate(timezone.now()), '')))
+            return [self._match(match_id) for _, match_id in self._match_order[start:start + limit]]
+
+    def match_details(self, match_id, with_seats=True):
+        with self._lock:
+            match = self._match(match_id)
+            if match is not None and with_seats:
+                set_related(match, 'seats', [{'ticket_id': ticket_id, 'seat_id': seat_id}
+                                             for ticket_id, seat_id in self._tickets_by_match[match_id].items()])
+        return match
+
+    def get_match(self, match_id):
+        with self._lock:
+            return self._match(match_id)
+
+    def create_match(self, properties, stadium):
+        properties = _properties(Match(**properties))
+        with self._lock:
+            self._matches[properties['match_id']] = (next(self._ids), properties)
+            self._match_venues[properties['match_id']] = stadium.stadium_id
+            bisect.insort(self._match_order, self._order_key(properties['match_id']))
+            match = self._match(properties['match_id'])
+        set_related(match, 'seats', [])
+        return match
+
+    def update_match(self, match, properties, stadium):
+        with self._lock:
+            self._match_order.remove(self._order_key(match.match_id))
+            self._matches[match.match_id][1].update(properties)
+            self._match_venues[match.match_id] = stadium.stadium_id
+            bisect.insort(self._match_order, self._order_key(match.match_id))
+            return self.match_details(match.match_id)
+
+    def match_seq(self, match_id):
+        with self._lock:
+            record = self._matches.get(match_id)
+            return None if record is None else record[1]['seq']
+
+    def seat_map(self, match_id):
+        with self._lock:
+            record = self._matches.get(match_id)
+            if record is None:
+                return None
+            _, stadium = self._stadiums[self._match_venues[match_id]]
+            return (record[1]['seq'], stadium['vip_rows'], stadium['vip_seats_per_row'],
+                    list(self._tickets_by_match[match_id].values()))
+
+    # Reservations
+
+    def reserve_seats(self, user, match_id, seat_ids, held_until=None, admitted=False):
+        # Same order of checks as Seat.reserve, seats outside of any possible VIP block first
+        if seat_layouts.largest().batch_indexes(seat_ids) is None:
+            return None, None
+        now = timezone.now()
+        with self._lock:
+            record = self._matches.get(match_id)
+            if record is None:
+                raise Match.DoesNotExist("There is no match with the given id")
+            if record[1]['admission_rate'] is not None and not admitted:
+                raise AdmissionRequired
+            _, stadium = self._stadiums[self._match_venues[match_id]]
+            layout = seat_layouts.get(stadium['vip_rows'], stadium['vip_seats_per_row'])
+            indexes = layout.batch_indexes(seat_ids)
+            if indexes is None:
+                return None, None
+            seat_ids = [layout.seat_ids[idx] for idx in indexes]
+            reservation_keys = [Seat.reservation_key_for(match_id, seat_id) for seat_id in seat_ids]
+            expired = []
+            for reservation_key in reservation_keys:
+                ticket_id = self._tickets_by_reservation_key.get(reservation_key)
+                if ticket_id is None:
+                    continue
+                hold_expiry = self._seats[ticket_id][1]['held_until']
+                if hold_expiry is None or hold_expiry >= now:
+                    raise UniqueProperty("Seat with property `reservation_key` = '{}' already exists"
+                                         .format(reservation_key))
+                expired.append(ticket_id)
+            for ticket_id in expired:
+                self._delete_seat(ticket_id)
+            seats = []
+            for seat_id, reservation_key in zip(seat_ids, reservation_keys):
+                properties = {'ticket_id': uuid.uuid4().hex, 'seat_id': seat_id, 'reservation_key': reservation_key,
+                              'held_until': held_until}
+                node_id = next(self._ids)
+                self._seats[properties['ticket_id']] = (node_id, properties, user.username, match_id)
+                if held_until is not None:
+                    heapq.heappush(self._holds, (held_until, properties['ticket_id']))
+                self._tickets_by_reservation_key[reservation_key] = properties['ticket_id']
+                self._tickets_by_user[user.username].add(properties['ticket_id'])
+                self._tickets_by_match[match_id][properties['ticket_id']] = seat_id
+                seats.append(self._node(Seat, node_id, properties))
+            record[1]['seq'] += 1
+            return seats, record[1]['seq']
+
+    def tickets(self, user, upcoming=False):
+        since = timezone.now() if upcoming else None
+        with self._lock:
+            seats = [self._seat(ticket_id) for ticket_id in self._tickets_by_user.get(user.username, ())
+                     if self._seats[ticket_id][1]['held_until'] is None]
+        seats = [seat for seat in seats if since is None or get_single_related(seat, 'match').date >= since]
+        return sorted(seats, key=lambda seat: (get_single_related(seat, 'match').date, seat.seat_id))
+
+    def cancel_reservation(self, user, ticket_id, deadline):
+        with self._lock:
+            if ticket_id not in self._tickets_by_user.get(user.username, ()):
+                return None
+            _, properties, _, match_id = self._seats[ticket_id]
+            if properties['held_until'] is not None:
+                return None
+            record = self._matches[match_id]
+            if record[1]['date'] < deadline:
+                return Cancellation(False, match_id, properties['seat_id'], record[1]['seq'])
+            self._delete_seat(ticket_id)
+            record[1]['seq'] += 1
+            return Cancellation(True, match_id, properties['seat_id'], record[1]['seq'])
+
+    def confirm_holds(self, user, ticket_ids):
+        now = timezone.now()
+        with self._lock:
+            held = [ticket_id for ticket_id in ticket_ids if ticket_id in self._tickets_by_user.get(user.username, ())
+                    and self._seats[ticket_id][1]['held_until'] is not None]
+            valid = len(held) == len(ticket_ids) and all(self._seats[ticket_id][1]['held_until'] >= now
+                                                         for ticket_id in held)
+            if valid:
+                for ticket_id in held:
+                    self._seats[ticket_id][1]['held_until'] = None
+            return [self._seat(ticket_id) for ticket_id in held], valid
+
+    def expire_holds(self, limit):
+        now = timezone.now()
+        released = defaultdict(list)
+        with self._lock:
+            count = 0
+            while self._holds and self._holds[0][0] < now and count < limit:
+                held_until, ticket_id = heapq.heappop(self._holds)
+                record = self._seats.get(ticket_id)
+                if record is None or record[1]['held_until'] != held_until:
+                    continue
+                released[record[3]].append(record[1]['seat_id'])
+                self._delete_seat(ticket_id)
+                count += 1
+            results = []
+            for match_id, seat_ids in released.items():
+                record = self._matches[match_id]
+                record[1]['seq'] += 1
+                results.append((match_id, seat_ids, record[1]['seq']))
+            return results
+
+    def _delete_seat(self, ticket_id):
+        _, properties, username, match_id = self._seats.pop(ticket_id)
+        del self._tickets_by_reservation_key[properties['reservation_key']]
+        self._tickets_by_user.get(username, set()).discard(ticket_id)
+        self._tickets_by_match[match_id].pop(ticket_id, None)
+        return match_id
@@ -0,0 +1,64 @@
+import functools
+import hashlib
+import json
+import threading
+
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .cache import TTLCache
+from .constants import RESPONSE_CACHE_MAX_SIZE, RESPONSE_CACHE_TTL
+from .invalidation import invalidate, listen_for_invalidations, on_invalidation
+
+response_cache = TTLCache(RESPONSE_CACHE_MAX_SIZE, RESPONSE_CACHE_TTL)
+_versions = {}
+_versions_lock = threading.Lock()
+
+
+@on_invalidation('responses')
+def _bump_version(namespace):
+    with _versions_lock:
+        _versions[namespace] = _versions.get(namespace, 0) + 1
+
+
+def invalidate_responses(namespace):
+    """
+    Drop every cached response of a namespace by moving it to a new version, so that responses computed from data
+    read before the write are never stored under the current one. The other workers of the host move on as soon as
+    they receive the invalidation, or once their entries expire if it is dropped
+    """
+    invalidate('responses', namespace)
+
+
+def compute_etag(data):
+    content = json.dumps(data, cls=JSONEncoder, sort_keys=True, separators=(',', ':'))
+    return quote_etag(hashlib.sha1(content.encode()).hexdigest())
+
+
+def cached_response(namespace):
+    """
+    Cache the successful responses of a read handler by namespace and query parameters, and answer requests whose
+    If-None-Match header matches the cached ETag with 304 Not Modified
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            listen_for_invalidations()
+            params = tuple(sorted((name, tuple(values)) for name, values in request.query_params.lists()))
+            key = (namespace, _versions.get(namespace, 0), params)
+            entry = response_cache.get(key)
+            if entry is None:
+                response = handler(view, request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                entry = (response.data, compute_etag(response.data))
+                response_cache.set(key, entry)
+            data, etag = entry
+            if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+            if etag in if_none_match or '*' in if_none_match:
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+            return Response(data=data, status=status.HTTP_200_OK, headers={'ETag': etag})
+        return wrapper
+    return decorator
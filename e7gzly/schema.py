@@ -0,0 +1,155 @@
+from collections import namedtuple
+
+from django.utils import timezone
+from neo4j.exceptions import ClientError
+from neomodel import config, db
+from neomodel.match import QueryBuilder
+
+from .constants import RESERVATION_KEYS_BACKFILL_BATCH_SIZE
+from .models import Match, Stadium, User
+from .queries import SCHEMA_INDEXES, RESERVE_SEATS, SEAT_MAP, TOKEN_USER, UPCOMING_MATCHES_AFTER, \
+    MATCH_DETAILS_WITH_SEATS, USER_RESERVATIONS, CANCEL_RESERVATION, ROTATE_TOKEN, AUTHORIZE_USERS, \
+    AUTHORIZE_MATCHING_USERS, CONFIRM_HOLDS, EXPIRE_HOLDS, BACKFILL_RESERVATION_KEYS, MISSING_RESERVATION_KEYS
+
+SchemaRule = namedtuple('SchemaRule', ['label', 'properties', 'unique'])
+ViewQuery = namedtuple('ViewQuery', ['view', 'query', 'params', 'full_listing'])
+
+SCHEMA = (
+    SchemaRule('Seat', ('ticket_id',), True),
+    # Composite uniqueness of (match_id, seat_id), Community Edition has no composite constraints
+    SchemaRule('Seat', ('reservation_key',), True),
+    SchemaRule('Seat', ('seat_id',), False),
+    SchemaRule('Seat', ('held_until',), False),
+    SchemaRule('Match', ('match_id',), True),
+    SchemaRule('Match', ('date',), False),
+    SchemaRule('Stadium', ('stadium_id',), True),
+    SchemaRule('Stadium', ('name',), True),
+    SchemaRule('User', ('username',), True),
+    SchemaRule('User', ('email',), True),
+    SchemaRule('User', ('role',), False),
+    SchemaRule('User', ('authorized',), False),
+    SchemaRule('User', ('first_name', 'last_name'), False),
+    SchemaRule('Token', ('key',), True),
+)
+
+LABEL_SCANS = ('AllNodesScan', 'NodeByLabelScan')
+
+
+def rule_name(rule):
+    return '_'.join((rule.label.lower(),) + rule.properties + ('unique' if rule.unique else 'index',))
+
+
+def existing_schema():
+    """
+    Map every single-label node index and uniqueness constraint of the database to its state
+    """
+    results, _ = db.cypher_query(SCHEMA_INDEXES)
+    return {SchemaRule(label, tuple(properties), unique): state for label, properties, unique, state in results}
+
+
+def verify_schema():
+    """
+    Map every declared rule that is missing or not yet online to its state, None if missing
+    """
+    existing = existing_schema()
+    return {rule: existing.get(rule) for rule in SCHEMA if existing.get(rule) != 'ONLINE'}
+
+
+def backfill_reservation_keys(batch_size=RESERVATION_KEYS_BACKFILL_BATCH_SIZE):
+    """
+    Give the seats reserved before reservation_key existed their key in batches, returns the number of updated seats
+    """
+    updated = 0
+    while True:
+        results, _ = db.cypher_query(BACKFILL_RESERVATION_KEYS, {'limit': batch_size})
+        updated += results[0][0]
+        if results[0][0] < batch_size:
+            return updated
+
+
+def missing_reservation_keys():
+    results, _ = db.cypher_query(MISSING_RESERVATION_KEYS)
+    return results[0][0]
+
+
+def install_schema():
+    """
+    Create the declared rules that are missing, returns the created rules
+    """
+    existing = existing_schema()
+    created = []
+    for rule in SCHEMA:
+        if rule in existing:
+            continue
+        if rule.unique:
+            query = "CREATE CONSTRAINT {} IF NOT EXISTS ON (n:{}) ASSERT n.{} IS UNIQUE".format(
+                rule_name(rule), rule.label, rule.properties[0])
+        else:
+            query = "CREATE INDEX {} IF NOT EXISTS FOR (n:{}) ON ({})".format(
+                rule_name(rule), rule.label, ', '.join('n.' + name for name in rule.properties))
+        try:
+            db.cypher_query(query)
+        except ClientError as e:
+            if e.code not in ('Neo.ClientError.Schema.EquivalentSchemaRuleAlreadyExists',
+                              'Neo.ClientError.Schema.IndexAlreadyExists',
+                              'Neo.ClientError.Schema.ConstraintAlreadyExists'):
+                raise
+            continue
+        created.append(rule)
+    return created
+
+
+def _node_set_query(view, node_set, full_listing=False):
+    builder = QueryBuilder(node_set).build_ast()
+    return ViewQuery(view, builder.build_query(), builder._query_params, full_listing)
+
+
+def view_queries():
+    """
+    The queries run by the views along with representative parameters
+    """
+    now = Match.date.deflate(timezone.now())
+    match_id = '0' * 32
+    return [
+        _node_set_query('MatchView.get', Match.nodes.filter(date__gte=timezone.now()).order_by('date')),
+        ViewQuery('MatchView.get (after)', UPCOMING_MATCHES_AFTER,
+                  {'now': now, 'date': now, 'match_id': match_id, 'limit': 21}, False),
+        ViewQuery('MatchDetailsView.get', MATCH_DETAILS_WITH_SEATS, {'match_id': match_id}, False),
+        ViewQuery('SeatMapView.get', SEAT_MAP, {'match_id': match_id}, False),
+        _node_set_query('StadiumView.get', Stadium.nodes, full_listing=True),
+        ViewQuery('ReservationView.get', USER_RESERVATIONS, {'user_id': 0, 'since': now}, False),
+        ViewQuery('ReservationView.post', RESERVE_SEATS,
+                  {'match_id': match_id, 'user_id': 0, 'seats': [], 'held_until': None, 'now': now, 'admitted': False},
+                  False),
+        ViewQuery('ReservationView.delete', CANCEL_RESERVATION,
+                  {'user_id': 0, 'ticket_id': match_id, 'deadline': now}, False),
+        ViewQuery('HoldView.put', CONFIRM_HOLDS, {'user_id': 0, 'ticket_ids': [], 'now': now}, False),
+        ViewQuery('expire_holds', EXPIRE_HOLDS, {'now': now, 'limit': 1}, False),
+        _node_set_query('UserView.get', User.nodes.order_by('first_name', 'last_name').filter(role__ne='admin'),
+                        full_listing=True),
+        _node_set_query('UserView.get (unauthorized)',
+                        User.nodes.order_by('first_name', 'last_name').filter(authorized=False, role__ne='admin')),
+        ViewQuery('AuthorizationView.patch (users)', AUTHORIZE_USERS, {'usernames': []}, False),
+        ViewQuery('AuthorizationView.patch (filter)', AUTHORIZE_MATCHING_USERS,
+                  {'role': None, 'registered_before': None}, False),
+        ViewQuery('LoggingInView.post', ROTATE_TOKEN,
+                  {'user_id': 0, 'password': '', 'new_password': '', 'now': now, 'token': {}}, False),
+        ViewQuery('TokenAuthentication', TOKEN_USER, {'key': ''}, False),
+    ]
+
+
+def plan_operators(plan):
+    yield plan['operatorType'].split('@')[0]
+    for child in plan.get('children', []):
+        yield from plan_operators(child)
+
+
+def explain(query, params):
+    """
+    The operators of the execution plan of a query, the query itself is not run
+    """
+    if db.driver is None:
+        db.set_connection(config.DATABASE_URL)
+    with db.driver.session(database=db._database_name) as session:
+        plan = session.run('EXPLAIN ' + query, params).consume().plan
+    return list(plan_operators(plan))
@@ -4,7 +4,11 @@ from rest_framework.exceptions import ValidationError
 
 from .constants import NAME_MAX_LEN, STADIUM_NAME_MAX_LEN, CITIES, GENDERS, TEAMS, ROLES, \
     SEAT_ID_MAX_LEN, ADDRESS_MAX_LEN, STADIUM_MIN_CAPACITY, VIP_SEATS_PER_ROW_MIN, VIP_ROWS_MIN, \
-    VIP_SEATS_PER_ROW_MAX, VIP_ROWS_MAX, DATETIME_FORMAT, MIN_AGE, USERS_PER_PAGE, MATCHES_PER_PAGE
+    VIP_SEATS_PER_ROW_MAX, VIP_ROWS_MAX, DATETIME_FORMAT, MIN_AGE, USERS_PER_PAGE, MATCHES_PER_PAGE, \
+    MAX_SEATS_PER_RESERVATION, MAX_USERS_PER_AUTHORIZATION
+from .layout import normalize_seat_id
+from .prefetch import get_related, get_single_related
+from .utilities import decode_cursor
 
 
 class UserBaseSerializer(serializers.Serializer):
@@ -37,6 +41,7 @@ class MatchBaseSerializer(serializers.Serializer):
     referee = serializers.CharField(required=True, allow_null=False, allow_blank=False, max_length=NAME_MAX_LEN)
     linesmen = serializers.ListField(required=True, child=serializers.CharField(allow_null=False, allow_blank=False,
                                                                                 max_length=NAME_MAX_LEN), min_length=2)
+    admission_rate = serializers.IntegerField(required=False, allow_null=True, min_value=1)
 
     def validate(self, data):
         if not isinstance(data['date'], timezone.datetime):
@@ -80,13 +85,25 @@ class SeatBaseSerializer(serializers.Serializer):
     seat_id = serializers.CharField(required=True, allow_null=False, allow_blank=False, max_length=SEAT_ID_MAX_LEN)
 
 
+class HoldSerializer(SeatBaseSerializer):
+    held_until = serializers.DateTimeField(allow_null=False, read_only=True)
+
+
 class MatchSerializer(MatchBaseSerializer):
     match_venue = StadiumBaseSerializer(read_only=True)
     seats = SeatBaseSerializer(read_only=True, many=True)
 
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
     def to_representation(self, instance):
-        instance.match_venue = instance.match_venue.single()
-        instance.seats = instance.seats.all()
+        if 'match_venue' in self.fields:
+            instance.match_venue = get_single_related(instance, 'match_venue')
+        if 'seats' in self.fields:
+            instance.seats = get_related(instance, 'seats')
         new_representation = super().to_representation(instance)
         return new_representation
 
@@ -96,7 +113,7 @@ class MatchOverviewSerializer(MatchBaseSerializer):
                                         read_only=True)
 
     def to_representation(self, instance):
-        instance.match_venue = instance.match_venue.single().name
+        instance.match_venue = get_single_related(instance, 'match_venue').name
         new_representation = super().to_representation(instance)
         return new_representation
 
@@ -105,7 +122,7 @@ class UserSerializer(UserBaseSerializer):
     reservations = SeatBaseSerializer(read_only=True, many=True)
 
     def to_representation(self, instance):
-        instance.reservations = instance.reservations.all()
+        instance.reservations = get_related(instance, 'reservations')
         new_representation = super().to_representation(instance)
         return new_representation
 
@@ -114,17 +131,16 @@ class StadiumSerializer(StadiumBaseSerializer):
     matches = MatchBaseSerializer(read_only=True, many=True)
 
     def to_representation(self, instance):
-        instance.matches = instance.matches.all()
+        instance.matches = get_related(instance, 'matches')
         new_representation = super().to_representation(instance)
         return new_representation
 
 
 class SeatSerializer(SeatBaseSerializer):
-    match = MatchBaseSerializer(read_only=True)
+    match = MatchOverviewSerializer(read_only=True)
 
     def to_representation(self, instance):
-        instance.match = instance.match.single()
-        instance.user = instance.user.single()
+        instance.match = get_single_related(instance, 'match')
         new_representation = super().to_representation(instance)
         return new_representation
 
@@ -136,28 +152,92 @@ class LoginDataSerializer(serializers.Serializer):
 
 class SeatReservationSerializer(serializers.Serializer):
     match_id = serializers.UUIDField(required=True, allow_null=False)
-    seat_id = serializers.CharField(required=True, allow_null=False, allow_blank=False, max_length=SEAT_ID_MAX_LEN)
+    seat_id = serializers.CharField(required=False, allow_null=False, allow_blank=False, max_length=SEAT_ID_MAX_LEN)
+    seat_ids = serializers.ListField(required=False, child=serializers.CharField(allow_null=False, allow_blank=False,
+                                                                                 max_length=SEAT_ID_MAX_LEN),
+                                     min_length=1, max_length=MAX_SEATS_PER_RESERVATION)
+    admission_pass = serializers.CharField(required=False, allow_null=False, allow_blank=False)
+
+    def validate(self, data):
+        if ('seat_id' in data) == ('seat_ids' in data):
+            raise ValidationError({"seat_id": "Exactly one of seat_id and seat_ids is required"})
+        if 'seat_ids' in data and len(set(map(normalize_seat_id, data['seat_ids']))) != len(data['seat_ids']):
+            raise ValidationError({"seat_ids": "Seat ids should not be repeated"})
+        return data
+
+
+class HoldConfirmationSerializer(serializers.Serializer):
+    ticket_ids = serializers.ListField(required=True, child=serializers.UUIDField(allow_null=False),
+                                       min_length=1, max_length=MAX_SEATS_PER_RESERVATION)
+
+    def validate_ticket_ids(self, value):
+        if len(set(value)) != len(value):
+            raise ValidationError("Ticket ids should not be repeated")
+        return [ticket_id.hex for ticket_id in value]
 
 
 class IdSerializer(serializers.Serializer):
     id = serializers.UUIDField(required=True, allow_null=False)
 
 
+class MatchDetailsRetrievalSerializer(IdSerializer):
+    fields = serializers.CharField(required=False, allow_null=False, allow_blank=False)
+
+    def validate_fields(self, value):
+        fields = [field.strip() for field in value.split(",")]
+        invalid_fields = set(fields) - set(MatchSerializer().fields)
+        if invalid_fields:
+            raise ValidationError("Unknown fields: {}".format(", ".join(sorted(invalid_fields))))
+        return fields
+
+
 class UsersRetrievalSerializer(serializers.Serializer):
     unauthorized = serializers.BooleanField(default=False, allow_null=False)
     users_per_page = serializers.IntegerField(default=USERS_PER_PAGE, allow_null=False)
     page_number = serializers.IntegerField(default=1, allow_null=False)
 
 
+class ReservationsRetrievalSerializer(serializers.Serializer):
+    upcoming = serializers.BooleanField(default=False, allow_null=False)
+
+
 class MatchesRetrievalSerializer(serializers.Serializer):
-    matches_per_page = serializers.IntegerField(default=MATCHES_PER_PAGE, allow_null=False)
+    matches_per_page = serializers.IntegerField(default=MATCHES_PER_PAGE, allow_null=False, min_value=1)
     page_number = serializers.IntegerField(default=1, allow_null=False)
+    after = serializers.CharField(required=False, allow_null=False, allow_blank=True)
+
+    def validate_after(self, value):
+        if value == "":
+            return 0.0, ""
+        cursor = decode_cursor(value, 2)
+        if cursor is None:
+            raise ValidationError("Invalid cursor")
+        try:
+            return float(cursor[0]), cursor[1]
+        except ValueError:
+            raise ValidationError("Invalid cursor")
 
 
 class UsernameSerializer(serializers.Serializer):
     user = serializers.CharField(required=True, allow_null=False, allow_blank=False, max_length=NAME_MAX_LEN)
 
 
+class BulkAuthorizationSerializer(serializers.Serializer):
+    users = serializers.ListField(required=False, child=serializers.CharField(allow_null=False, allow_blank=False,
+                                                                              max_length=NAME_MAX_LEN),
+                                  min_length=1, max_length=MAX_USERS_PER_AUTHORIZATION)
+    # Admins are always authorized
+    role = serializers.ChoiceField(required=False, choices=[role for role in ROLES if role[0] != 'admin'],
+                                   allow_null=False, allow_blank=False)
+    registered_before = serializers.DateTimeField(required=False, allow_null=False)
+
+    def validate(self, data):
+        filtering = 'role' in data or 'registered_before' in data
+        if ('users' in data) == filtering:
+            raise ValidationError({"users": "Either a list of users or a role/registered_before filter is required"})
+        return data
+
+
 class UserEditingSerializer(serializers.Serializer):
     first_name = serializers.CharField(required=True, allow_null=False, allow_blank=False, max_length=NAME_MAX_LEN)
     last_name = serializers.CharField(required=True, allow_null=False, allow_blank=False, max_length=NAME_MAX_LEN)
@@ -0,0 +1,280 @@
+import base64
+import datetime
+import uuid
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+from django.utils.functional import empty
+from rest_framework.test import APIClient
+
+from .admission import spent_passes
+from .authentication import token_cache
+from .constants import TICKET_CANCELLATION_WINDOW
+from .layout import seat_layouts
+from .repositories import repository
+from .responses import response_cache
+
+
+@override_settings(REPOSITORY_BACKEND='e7gzly.repositories.memory.InMemoryRepository')
+class APITestCase(SimpleTestCase):
+    """
+    Runs the API against a fresh in-memory repository
+    """
+
+    def setUp(self):
+        repository._wrapped = empty
+        for local_cache in (token_cache, response_cache, spent_passes):
+            local_cache.clear()
+        cache.clear()
+        self.client = APIClient()
+
+    def tearDown(self):
+        repository._wrapped = empty
+
+    def create_user(self, username, role='fan', authorized=True, **properties):
+        _, token = repository.register_user(dict({
+            'username': username,
+            'email': '{}@example.com'.format(username),
+            'password': 'unused',
+            'first_name': 'First',
+            'last_name': 'Last',
+            'birthdate': datetime.date(1990, 1, 1),
+            'gender': 'male',
+            'city': 'cairo',
+            'role': role,
+            'authorized': authorized
+        }, **properties))
+        return token.key
+
+    def create_match(self, days=10, vip_rows=5, vip_seats_per_row=6):
+        stadium = repository.create_stadium({
+            'name': 'Stadium {}'.format(uuid.uuid4().hex[:8]),
+            'capacity': 10000,
+            'vip_rows': vip_rows,
+            'vip_seats_per_row': vip_seats_per_row
+        })
+        match = repository.create_match({
+            'home_team': 'al ahly sc',
+            'away_team': 'zamalek sc',
+            'date': timezone.now() + datetime.timedelta(days=days),
+            'referee': 'Referee',
+            'linesmen': ['Linesman 1', 'Linesman 2']
+        }, stadium)
+        return match.match_id
+
+    def request(self, method, path, data=None, token=None):
+        self.client.credentials(**({'HTTP_AUTHORIZATION': 'Bearer ' + token} if token else {}))
+        if method == 'get':
+            return self.client.get(path, data)
+        return getattr(self.client, method)(path, data, format='json')
+
+    def reserved_seats(self, match_id):
+        response = self.request('get', '/match/seats/', {'id': match_id})
+        self.assertEqual(response.status_code, 200)
+        layout = seat_layouts.get(response.data['rows'], response.data['seats_per_row'])
+        bits = base64.b64decode(response.data['seats'])
+        return {seat_id for idx, seat_id in enumerate(layout.seat_ids) if bits[idx >> 3] & (0x80 >> (idx & 7))}
+
+
+class ReservationTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.token = self.create_user('fan')
+        self.match_id = self.create_match()
+
+    def reserve(self, data, path='/reservations/', token=None):
+        return self.request('post', path, dict(data, match_id=self.match_id), token or self.token)
+
+    def test_reserve(self):
+        response = self.reserve({'seat_id': 'a1'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['seat_id'], 'A1')
+        self.assertEqual(self.reserve({'seat_id': 'A1'}).status_code, 409)
+        self.assertEqual(self.reserved_seats(self.match_id), {'A1'})
+        response = self.request('get', '/reservations/', {'upcoming': 'true'}, self.token)
+        self.assertEqual([seat['seat_id'] for seat in response.data], ['A1'])
+
+    def test_reserve_batch_all_or_nothing(self):
+        self.assertEqual(self.reserve({'seat_ids': ['A0', 'A1']}).status_code, 201)
+        self.assertEqual(self.reserve({'seat_ids': ['B0', 'A1']}).status_code, 409)
+        self.assertEqual(self.reserve({'seat_ids': ['B0', 'Z9']}).status_code, 400)
+        self.assertEqual(self.reserve({'seat_ids': ['B0', 'b0']}).status_code, 400)
+        self.assertEqual(self.reserved_seats(self.match_id), {'A0', 'A1'})
+
+    def test_reserve_invalid_seat(self):
+        # Part of some stadium's layout, but not of this one's
+        self.assertEqual(self.reserve({'seat_id': 'F0'}).status_code, 400)
+        self.assertEqual(self.reserve({'seat_id': 'A6'}).status_code, 400)
+        self.assertEqual(self.reserved_seats(self.match_id), set())
+
+    def test_reserve_missing_match(self):
+        self.match_id = uuid.uuid4().hex
+        self.assertEqual(self.reserve({'seat_id': 'A0'}).status_code, 404)
+        # Seats outside of any layout are rejected before the match is looked up, as with Neo4j
+        self.assertEqual(self.reserve({'seat_id': 'not a seat'}).status_code, 400)
+
+    def test_reserve_unauthorized(self):
+        token = self.create_user('unauthorized', authorized=False)
+        self.assertEqual(self.reserve({'seat_id': 'A0'}, token=token).status_code, 403)
+        self.assertEqual(self.reserve({'seat_id': 'A0'}, token='invalid').status_code, 401)
+
+    def test_cancel(self):
+        ticket_id = self.reserve({'seat_id': 'A0'}).data['ticket_id']
+        response = self.request('delete', '/reservations/?id={}'.format(ticket_id), token=self.token)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.reserved_seats(self.match_id), set())
+        response = self.request('delete', '/reservations/?id={}'.format(ticket_id), token=self.token)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.reserve({'seat_id': 'A0'}).status_code, 201)
+
+    def test_cancel_within_window(self):
+        self.match_id = self.create_match(days=TICKET_CANCELLATION_WINDOW - 1)
+        ticket_id = self.reserve({'seat_id': 'A0'}).data['ticket_id']
+        response = self.request('delete', '/reservations/?id={}'.format(ticket_id), token=self.token)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.reserved_seats(self.match_id), {'A0'})
+
+    def test_cancel_of_another_user(self):
+        ticket_id = self.reserve({'seat_id': 'A0'}).data['ticket_id']
+        token = self.create_user('other')
+        response = self.request('delete', '/reservations/?id={}'.format(ticket_id), token=token)
+        self.assertEqual(response.status_code, 404)
+
+    def test_hold_and_confirm(self):
+        response = self.reserve({'seat_ids': ['A0', 'A1']}, path='/reservations/holds/')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(all(seat['held_until'] for seat in response.data))
+        ticket_ids = [seat['ticket_id'] for seat in response.data]
+        self.assertEqual(self.reserved_seats(self.match_id), {'A0', 'A1'})
+        self.assertEqual(self.reserve({'seat_id': 'A0'}, token=self.create_user('other')).status_code, 409)
+        # Holds are not reservations until confirmed
+        self.assertEqual(self.request('get', '/reservations/', token=self.token).data, [])
+        response = self.request('put', '/reservations/holds/', {'ticket_ids': ticket_ids}, self.token)
+        self.assertEqual(response.status_code, 200)
+        response = self.request('get', '/reservations/', token=self.token)
+        self.assertEqual(sorted(seat['seat_id'] for seat in response.data), ['A0', 'A1'])
+        response = self.request('put', '/reservations/holds/', {'ticket_ids': ticket_ids}, self.token)
+        self.assertEqual(response.status_code, 404)
+
+    def test_confirm_expired_hold(self):
+        user = repository.get_user('fan')
+        seats, _ = repository.reserve_seats(user, self.match_id, ['A0'], timezone.now() - datetime.timedelta(seconds=1))
+        response = self.request('put', '/reservations/holds/', {'ticket_ids': [seats[0].ticket_id]}, self.token)
+        self.assertEqual(response.status_code, 409)
+        # An expired hold gives way to the next reservation of its seat
+        self.assertEqual(self.reserve({'seat_id': 'A0'}, token=self.create_user('other')).status_code, 201)
+
+    def test_expire_holds(self):
+        user = repository.get_user('fan')
+        repository.reserve_seats(user, self.match_id, ['A0', 'A1'], timezone.now() - datetime.timedelta(seconds=1))
+        repository.reserve_seats(user, self.match_id, ['B0'], timezone.now() + datetime.timedelta(minutes=1))
+        [(match_id, seat_ids, seq)] = repository.expire_holds(10)
+        self.assertEqual((match_id, sorted(seat_ids), seq), (self.match_id, ['A0', 'A1'], 3))
+        self.assertEqual(repository.expire_holds(10), [])
+
+
+class SeatMapTests(APITestCase):
+    def test_seat_map(self):
+        match_id = self.create_match(vip_rows=3, vip_seats_per_row=4)
+        response = self.request('get', '/match/seats/', {'id': match_id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['seq'], response.data['rows'], response.data['seats_per_row']), (0, 3, 4))
+        self.assertEqual(base64.b64decode(response.data['seats']), bytes(2))
+        token = self.create_user('fan')
+        self.request('post', '/reservations/', {'match_id': match_id, 'seat_ids': ['A0', 'C3']}, token)
+        self.assertEqual(self.reserved_seats(match_id), {'A0', 'C3'})
+        self.assertEqual(base64.b64decode(self.request('get', '/match/seats/', {'id': match_id}).data['seats']),
+                         bytes([0x80, 0x10]))
+
+    def test_seat_map_reloads_on_missing_change(self):
+        match_id = self.create_match()
+        token = self.create_user('fan')
+        self.assertEqual(self.reserved_seats(match_id), set())
+        # Changes made outside of the views are not published, the next published one reveals the gap
+        repository.reserve_seats(repository.get_user('fan'), match_id, ['B2'])
+        self.request('post', '/reservations/', {'match_id': match_id, 'seat_id': 'C3'}, token)
+        self.assertEqual(self.reserved_seats(match_id), {'B2', 'C3'})
+
+    def test_seat_map_missing_match(self):
+        response = self.request('get', '/match/seats/', {'id': uuid.uuid4().hex})
+        self.assertEqual(response.status_code, 404)
+
+
+class MatchCursorTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_match(days=-1)
+        self.match_ids = [self.create_match(days=days) for days in (3, 1, 2, 2)]
+
+    def test_pages(self):
+        expected = [repository.get_match(match_id) for match_id in self.match_ids]
+        expected = [match.match_id for match in sorted(expected, key=lambda match: (match.date, match.match_id))]
+        pages, after = [], ''
+        while after is not None:
+            response = self.request('get', '/matches/', {'after': after, 'matches_per_page': 3})
+            self.assertEqual(response.status_code, 200)
+            pages.append([uuid.UUID(match['match_id']).hex for match in response.data['matches']])
+            after = response.data['next']
+        self.assertEqual(pages, [expected[:3], expected[3:]])
+
+    def test_last_page(self):
+        response = self.request('get', '/matches/', {'after': '', 'matches_per_page': 4})
+        self.assertEqual(len(response.data['matches']), 4)
+        self.assertIsNone(response.data['next'])
+
+    def test_invalid_cursor(self):
+        response = self.request('get', '/matches/', {'after': 'invalid'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_page_numbers(self):
+        response = self.request('get', '/matches/', {'matches_per_page': 3, 'page_number': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+
+
+class BulkAuthorizationTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = self.create_user('admin', role='admin')
+        self.fans = [self.create_user('fan{}'.format(idx), authorized=False) for idx in range(3)]
+        self.manager = self.create_user('manager', role='manager', authorized=False)
+
+    def authorize(self, data, token=None):
+        return self.request('patch', '/account/authorization/', data, token or self.admin)
+
+    def authorized(self):
+        return {user.username for user in repository.users() if user.authorized}
+
+    def test_usernames(self):
+        response = self.authorize({'users': ['fan0', 'fan1', 'missing']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['users'], [{'user': 'fan0', 'authorized': True},
+                                                  {'user': 'fan1', 'authorized': True},
+                                                  {'user': 'missing', 'authorized': False}])
+        self.assertEqual(self.authorized(), {'fan0', 'fan1'})
+
+    def test_role(self):
+        response = self.authorize({'role': 'manager'})
+        self.assertEqual(response.data['users'], [{'user': 'manager', 'authorized': True}])
+        self.assertEqual(self.authorized(), {'manager'})
+
+    def test_registered_before(self):
+        response = self.authorize({'registered_before': (timezone.now() + datetime.timedelta(minutes=1)).isoformat()})
+        self.assertEqual(self.authorized(), {'fan0', 'fan1', 'fan2', 'manager'})
+        self.assertEqual(len(response.data['users']), 4)
+        self.assertEqual(self.authorize({'role': 'fan'}).data['users'], [])
+
+    def test_invalid(self):
+        self.assertEqual(self.authorize({'role': 'admin'}).status_code, 400)
+        self.assertEqual(self.authorize({'users': ['fan0'], 'role': 'fan'}).status_code, 400)
+        self.assertEqual(self.authorize({}).status_code, 400)
+        self.assertEqual(self.authorize({'users': ['fan0']}, token=self.manager).status_code, 403)
+        self.assertEqual(self.authorized(), set())
+
+    def test_cached_tokens_are_forgotten(self):
+        match_id = self.create_match()
+        data = {'match_id': match_id, 'seat_id': 'A0'}
+        self.assertEqual(self.request('post', '/reservations/', data, self.fans[0]).status_code, 403)
+        self.authorize({'users': ['fan0']})
+        self.assertEqual(self.request('post', '/reservations/', data, self.fans[0]).status_code, 201)
@@ -0,0 +1,45 @@
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+from .models import User
+
+
+class UserRateThrottle(SimpleRateThrottle):
+    """
+    Limits the requests of every authenticated user, keyed by username so that it holds across token rotations.
+    Anonymous requests are not limited
+    """
+
+    def get_rate(self):
+        # Read on every request rather than once per class, so that the rates follow settings overrides
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def parse_rate(self, rate):
+        num_requests, duration = super().parse_rate(rate)
+        if num_requests is None:
+            return num_requests, duration
+        return max(1, num_requests // settings.WORKER_PROCESSES), duration
+
+    def applies_to(self, request):
+        return True
+
+    def get_cache_key(self, request, view):
+        if type(request.user) is not User or not self.applies_to(request):
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': request.user.username}
+
+
+class UserReadRateThrottle(UserRateThrottle):
+    scope = 'user_reads'
+
+    def applies_to(self, request):
+        return request.method in SAFE_METHODS
+
+
+class UserWriteRateThrottle(UserRateThrottle):
+    scope = 'user_writes'
+
+    def applies_to(self, request):
+        return request.method not in SAFE_METHODS
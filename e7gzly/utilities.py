@@ -1,7 +1,25 @@
-def row_to_number(row):
-    row = row.lower()
-    idx = 0
-    for digit in row:
-        idx *= 26
-        idx += ord(digit) - ord('a') + 1
-    return idx - 1
+import base64
+import binascii
+
+
+def number_to_row(number):
+    row = ''
+    number += 1
+    while number:
+        number, digit = divmod(number - 1, 26)
+        row = chr(ord('A') + digit) + row
+    return row
+
+
+def encode_cursor(*values):
+    return base64.urlsafe_b64encode(",".join(str(value) for value in values).encode()).decode()
+
+
+def decode_cursor(cursor, count):
+    try:
+        values = base64.urlsafe_b64decode(cursor.encode()).decode().split(",")
+    except (binascii.Error, UnicodeError):
+        return None
+    if len(values) != count:
+        return None
+    return values
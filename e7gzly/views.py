@@ -1,3 +1,5 @@
+import os
+
 from django.core.paginator import Paginator, PageNotAnInteger, InvalidPage
 from django.utils import timezone
 from neomodel import UniqueProperty
@@ -6,15 +8,24 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_condition import And, Or
-from .models import Match, Stadium, User, Token, Seat
-from .constants import TICKET_CANCELLATION_WINDOW
+from .models import Match
+from .constants import TICKET_CANCELLATION_WINDOW, SEAT_HOLD_TTL
+from .admission import spend_pass
+from .authentication import forget_token, forget_user
+from .concurrency import AsyncReadAPIView
+from .hashing import password_hasher
+from .instrumentation import view_metrics
+from .occupancy import seat_maps, invalidate_seat_map, Delta
+from .repositories import repository
+from .responses import cached_response, invalidate_responses
 from .serializers import MatchSerializer, MatchBaseSerializer, UserBaseSerializer, \
     LoginDataSerializer, StadiumSerializer, StadiumBaseSerializer, SeatSerializer, SeatReservationSerializer, \
     IdSerializer, UsersRetrievalSerializer, MatchesRetrievalSerializer, UsernameSerializer, \
-    UserEditingSerializer, ChangePasswordSerializer, MatchOverviewSerializer, SeatBaseSerializer
+    UserEditingSerializer, ChangePasswordSerializer, MatchOverviewSerializer, SeatBaseSerializer, \
+    MatchDetailsRetrievalSerializer, ReservationsRetrievalSerializer, BulkAuthorizationSerializer, HoldSerializer, \
+    HoldConfirmationSerializer
 from .permissions import IsReadOnlyRequest, IsPostRequest, IsPutRequest, IsManager, IsAuthorized, IsAdmin, \
     IsUser, IsDeleteRequest
-from django.contrib.auth.hashers import make_password, check_password
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 
@@ -30,11 +41,9 @@ class RegistrationView(APIView):
         serializer = UserBaseSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user_data = serializer.validated_data
-        user_data['password'] = make_password(user_data['password'])
+        user_data['password'] = password_hasher.make_password(user_data['password'])
         try:
-            user = User.create(user_data)[0]
-            token = Token().save()
-            user.token.connect(token)
+            user, token = repository.register_user(user_data)
             return Response(data={
                 'token': token.key,
                 'role': user.role
@@ -53,25 +62,43 @@ class AuthorizationView(APIView):
 
     def patch(self, request):
         """
-        Authorize a user
+        Authorize a user, or a batch of users given by their usernames or by a filter
         """
+        if 'user' not in request.query_params:
+            return self.bulk_patch(request)
         serializer = UsernameSerializer(data=request.query_params)
         serializer.is_valid(raise_exception=True)
         username = serializer.validated_data['user']
-        try:
-            user = User.nodes.get(username=username)
-        except User.DoesNotExist:
+        user = repository.get_user(username)
+        if user is None:
             return Response(data={"user": ["There is no user with the given username"]},
                             status=status.HTTP_404_NOT_FOUND)
         user.authorized = True
-        user.save()
+        repository.save_user(user)
+        forget_user(user)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def bulk_patch(self, request):
+        serializer = BulkAuthorizationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if 'users' in serializer.validated_data:
+            results = repository.authorize_usernames(serializer.validated_data['users'])
+        else:
+            results = repository.authorize_matching(serializer.validated_data.get('role', None),
+                                              serializer.validated_data.get('registered_before', None))
+        for _, _, keys in results:
+            for key in keys:
+                forget_token(key)
+        return Response(data={
+            "users": [{"user": username, "authorized": found} for username, found, _ in results]
+        }, status=status.HTTP_200_OK)
+
 
-class MatchView(APIView):
+class MatchView(AsyncReadAPIView):
     authentication_classes = []
     permission_classes = []
 
+    @cached_response('matches')
     def get(self, request):
         """
         Retrieve a list of matches
@@ -80,7 +107,15 @@ class MatchView(APIView):
         serializer.is_valid(raise_exception=True)
         matches_per_page = serializer.validated_data['matches_per_page']
         page_number = serializer.validated_data['page_number']
-        matches = Match.nodes.filter(date__gte=timezone.now()).order_by('date')
+        if 'after' in serializer.validated_data:
+            date, match_id = serializer.validated_data['after']
+            matches = repository.upcoming_matches_after(date, match_id, matches_per_page + 1)
+            next_cursor = matches[matches_per_page - 1].cursor if len(matches) > matches_per_page else None
+            return Response(data={
+                'matches': MatchOverviewSerializer(matches[:matches_per_page], many=True).data,
+                'next': next_cursor
+            }, status=status.HTTP_200_OK)
+        matches = repository.upcoming_matches()
         paginator = Paginator(matches, matches_per_page)
         try:
             matches = paginator.page(page_number)
@@ -88,11 +123,11 @@ class MatchView(APIView):
             matches = paginator.page(1)
         except InvalidPage:
             matches = []
-        matches = MatchOverviewSerializer(matches, many=True).data
+        matches = MatchOverviewSerializer(repository.with_venues(matches), many=True).data
         return Response(data=matches, status=status.HTTP_200_OK)
 
 
-class MatchDetailsView(APIView):
+class MatchDetailsView(AsyncReadAPIView):
     permission_classes = [Or(IsReadOnlyRequest,
                              And(Or(IsPostRequest, IsPutRequest), Or(And(IsManager, IsAuthorized), IsAdmin)))]
 
@@ -100,14 +135,15 @@ class MatchDetailsView(APIView):
         """
         Retrieve match details
         """
-        serializer = IdSerializer(data=request.query_params)
+        serializer = MatchDetailsRetrievalSerializer(data=request.query_params)
         serializer.is_valid(raise_exception=True)
-        try:
-            match = Match.nodes.get(match_id=serializer.validated_data['id'].hex)
-        except Match.DoesNotExist:
+        fields = serializer.validated_data.get('fields', None)
+        match = repository.match_details(serializer.validated_data['id'].hex,
+                                         with_seats=fields is None or 'seats' in fields)
+        if match is None:
             return Response(data={"id": ["There is no match with the given id"]},
                             status=status.HTTP_404_NOT_FOUND)
-        return Response(data=MatchSerializer(match).data, status=status.HTTP_200_OK)
+        return Response(data=MatchSerializer(match, fields=fields).data, status=status.HTTP_200_OK)
 
     def post(self, request):
         """
@@ -118,13 +154,12 @@ class MatchDetailsView(APIView):
             return Response(data={"match_venue": ["This field is required"]}, status=status.HTTP_400_BAD_REQUEST)
         serializer = MatchBaseSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        try:
-            stadium = Stadium.nodes.get(stadium_id=stadium_id)
-        except Stadium.DoesNotExist:
+        stadium = repository.get_stadium(stadium_id)
+        if stadium is None:
             return Response(data={"match_venue": ["There is no stadium with the given id"]},
                             status=status.HTTP_404_NOT_FOUND)
-        match = Match.create(serializer.validated_data)[0]
-        match.match_venue.connect(stadium)
+        match = repository.create_match(serializer.validated_data, stadium)
+        invalidate_responses('matches')
         return Response(data=MatchSerializer(match).data, status=status.HTTP_201_CREATED)
 
     def put(self, request):
@@ -139,35 +174,55 @@ class MatchDetailsView(APIView):
             return Response(data={"match_venue": ["This field is required"]}, status=status.HTTP_400_BAD_REQUEST)
         serializer = MatchBaseSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        try:
-            match = Match.nodes.get(match_id=match_id)
-        except Match.DoesNotExist:
+        match = repository.get_match(match_id)
+        if match is None:
             return Response(data={"match_id": ["There is no match with the given id"]},
                             status=status.HTTP_404_NOT_FOUND)
-        try:
-            stadium = Stadium.nodes.get(stadium_id=stadium_id)
-        except Stadium.DoesNotExist:
+        stadium = repository.get_stadium(stadium_id)
+        if stadium is None:
             return Response(data={"match_venue": ["There is no stadium with the given id"]},
                             status=status.HTTP_404_NOT_FOUND)
-        match.home_team = serializer.validated_data['home_team']
-        match.away_team = serializer.validated_data['away_team']
-        match.date = serializer.validated_data['date']
-        match.referee = serializer.validated_data['referee']
-        match.linesmen = serializer.validated_data['linesmen']
-        match.save()
-        match.match_venue.reconnect(match.match_venue.single(), stadium)
+        match = repository.update_match(match, {
+            'home_team': serializer.validated_data['home_team'],
+            'away_team': serializer.validated_data['away_team'],
+            'date': serializer.validated_data['date'],
+            'referee': serializer.validated_data['referee'],
+            'linesmen': serializer.validated_data['linesmen'],
+            'admission_rate': serializer.validated_data.get('admission_rate')
+        }, stadium)
+        invalidate_seat_map(match.match_id)
+        invalidate_responses('matches')
         return Response(data=MatchSerializer(match).data, status=status.HTTP_200_OK)
 
 
-class StadiumView(APIView):
+class SeatMapView(APIView):
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, request):
+        """
+        Retrieve the seat occupancy of a match as a packed bitstring
+        """
+        serializer = IdSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        match_id = serializer.validated_data['id'].hex
+        snapshot = seat_maps.snapshot(match_id)
+        if snapshot is None:
+            return Response(data={"id": ["There is no match with the given id"]},
+                            status=status.HTTP_404_NOT_FOUND)
+        return Response(data=dict(snapshot, match_id=match_id), status=status.HTTP_200_OK)
+
+
+class StadiumView(AsyncReadAPIView):
     permission_classes = [Or(IsReadOnlyRequest,
                              And(IsPostRequest, Or(And(IsManager, IsAuthorized), IsAdmin)))]
 
+    @cached_response('stadiums')
     def get(self, request):
         """
         Retrieve a list of all stadiums
         """
-        return Response(data=StadiumBaseSerializer(Stadium.nodes, many=True).data, status=status.HTTP_200_OK)
+        return Response(data=StadiumBaseSerializer(repository.stadiums(), many=True).data, status=status.HTTP_200_OK)
 
     def post(self, request):
         """
@@ -175,11 +230,39 @@ class StadiumView(APIView):
         """
         serializer = StadiumBaseSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        stadium = Stadium.create(serializer.validated_data)[0]
+        stadium = repository.create_stadium(serializer.validated_data)
+        invalidate_responses('stadiums')
         return Response(data=StadiumSerializer(stadium).data, status=status.HTTP_201_CREATED)
 
 
-class ReservationView(APIView):
+def reserve_seats(request, seat_serializer_class, held_until=None):
+    """
+    Reserve or hold the requested seats and publish them to the match's seat map followers
+    """
+    serializer = SeatReservationSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    match_id = serializer.validated_data['match_id']
+    seat_ids = serializer.validated_data.get('seat_ids', None) or [serializer.validated_data['seat_id']]
+    admitted = spend_pass(serializer.validated_data.get('admission_pass'), match_id.hex, request.user.username)
+    try:
+        seats, seq = repository.reserve_seats(request.user, match_id.hex, seat_ids, held_until, admitted)
+    except Match.DoesNotExist:
+        return Response(data={"match_id": ["There is no match with the given id"]},
+                        status=status.HTTP_404_NOT_FOUND)
+    except UniqueProperty:
+        return Response(data={"seat_id": ["Seat is already reserved"]}, status=status.HTTP_409_CONFLICT)
+    if seats is None:
+        return Response(data={"seat_id": ["Invalid seat_id"]}, status=status.HTTP_400_BAD_REQUEST)
+    seat_ids = [seat.seat_id for seat in seats]
+    seat_maps.apply(match_id.hex, Delta(seq, seat_ids, []))
+    channel_layer = get_channel_layer()
+    async_to_sync(channel_layer.group_send)(match_id.hex, {"type": "update", "seq": seq, "seat_ids": seat_ids})
+    if 'seat_ids' in serializer.validated_data:
+        return Response(data=seat_serializer_class(seats, many=True).data, status=status.HTTP_201_CREATED)
+    return Response(data=seat_serializer_class(seats[0]).data, status=status.HTTP_201_CREATED)
+
+
+class ReservationView(AsyncReadAPIView):
     permission_classes = [Or(And(Or(IsReadOnlyRequest, IsDeleteRequest), IsUser),
                              And(IsPostRequest, IsAuthorized))]
 
@@ -187,32 +270,16 @@ class ReservationView(APIView):
         """
         Retrieve reserved seats for a user
         """
-        return Response(data=SeatSerializer(request.user.reservations.all(), many=True).data, status=status.HTTP_200_OK)
+        serializer = ReservationsRetrievalSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        seats = repository.tickets(request.user, upcoming=serializer.validated_data['upcoming'])
+        return Response(data=SeatSerializer(seats, many=True).data, status=status.HTTP_200_OK)
 
     def post(self, request):
         """
-        Reserve a vacant seat for a match
+        Reserve a vacant seat, or a batch of vacant seats all-or-nothing, for a match
         """
-        serializer = SeatReservationSerializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        match_id = serializer.validated_data['match_id']
-        seat_id = serializer.validated_data['seat_id']
-        try:
-            match = Match.nodes.get(match_id=match_id.hex)
-        except Match.DoesNotExist:
-            return Response(data={"match_id": ["There is no match with the given id"]},
-                            status=status.HTTP_404_NOT_FOUND)
-        if not match.match_venue.single().is_valid_seat(seat_id):
-            return Response(data={"seat_id": ["Invalid seat_id"]}, status=status.HTTP_400_BAD_REQUEST)
-        if not match.is_available_seat(seat_id):
-            return Response(data={"seat_id": ["Seat is already reserved"]}, status=status.HTTP_409_CONFLICT)
-        seat = Seat(seat_id=seat_id).save()
-        user = request.user
-        user.reservations.connect(seat)
-        seat.match.connect(match)
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(match.match_id, {"type": "update", "seat_id": seat.seat_id})
-        return Response(data=SeatBaseSerializer(seat).data, status=status.HTTP_201_CREATED)
+        return reserve_seats(request, SeatBaseSerializer)
 
     def delete(self, request):
         """
@@ -220,19 +287,50 @@ class ReservationView(APIView):
         """
         serializer = IdSerializer(data=request.query_params)
         serializer.is_valid(raise_exception=True)
-        user = request.user
-        try:
-            reservation = user.reservations.get(ticket_id=serializer.validated_data['id'].hex)
-        except Seat.DoesNotExist:
+        cancellation = repository.cancel_reservation(
+            request.user, serializer.validated_data['id'].hex,
+            timezone.now() + timezone.timedelta(days=TICKET_CANCELLATION_WINDOW))
+        if cancellation is None:
             return Response(data={"id": ["There is no reservation with the given id"]},
                             status=status.HTTP_404_NOT_FOUND)
-        if timezone.now() > reservation.match.single().date - timezone.timedelta(days=TICKET_CANCELLATION_WINDOW):
+        if not cancellation.cancelled:
             return Response(data="Reservations can be cancelled in at least {} days before the corresponding event"
                             .format(TICKET_CANCELLATION_WINDOW), status=status.HTTP_403_FORBIDDEN)
-        reservation.delete()
+        seat_maps.apply(cancellation.match_id, Delta(cancellation.seq, [], [cancellation.seat_id]))
+        channel_layer = get_channel_layer()
+        async_to_sync(channel_layer.group_send)(cancellation.match_id, {
+            "type": "update",
+            "seq": cancellation.seq,
+            "released_seat_ids": [cancellation.seat_id]
+        })
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class HoldView(APIView):
+    permission_classes = [IsAuthorized]
+
+    def post(self, request):
+        """
+        Hold a vacant seat, or a batch of vacant seats all-or-nothing, for a match until it is confirmed or expires
+        """
+        return reserve_seats(request, HoldSerializer, timezone.now() + timezone.timedelta(seconds=SEAT_HOLD_TTL))
+
+    def put(self, request):
+        """
+        Confirm a batch of held seats all-or-nothing, turning them into reservations
+        """
+        serializer = HoldConfirmationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ticket_ids = serializer.validated_data['ticket_ids']
+        seats, confirmed = repository.confirm_holds(request.user, ticket_ids)
+        if len(seats) != len(ticket_ids):
+            return Response(data={"ticket_ids": ["There is no hold with the given id"]},
+                            status=status.HTTP_404_NOT_FOUND)
+        if not confirmed:
+            return Response(data={"ticket_ids": ["Hold has expired"]}, status=status.HTTP_409_CONFLICT)
+        return Response(data=SeatBaseSerializer(seats, many=True).data, status=status.HTTP_200_OK)
+
+
 class LoggingInView(ObtainAuthToken):
     authentication_classes = []
     permission_classes = []
@@ -245,17 +343,17 @@ class LoggingInView(ObtainAuthToken):
         serializer.is_valid(raise_exception=True)
         username = serializer.validated_data['username']
         password = serializer.validated_data['password']
-        try:
-            user = User.nodes.get(username=username)
-        except User.DoesNotExist:
+        user = repository.get_user(username)
+        if user is None:
+            return Response(data="Incorrect credentials", status=status.HTTP_401_UNAUTHORIZED)
+        correct, rehashed_password = password_hasher.check_password(password, user.password)
+        if not correct:
             return Response(data="Incorrect credentials", status=status.HTTP_401_UNAUTHORIZED)
-        if not check_password(password, user.password):
+        token, old_keys = repository.rotate_token(user, rehashed_password)
+        if token is None:
             return Response(data="Incorrect credentials", status=status.HTTP_401_UNAUTHORIZED)
-        token = user.token.single()
-        if token is not None:
-            token.delete()
-        token = Token().save()
-        user.token.connect(token)
+        for key in old_keys:
+            forget_token(key)
         return Response(data={
             'token': token.key,
             'role': user.role
@@ -274,11 +372,7 @@ class UserView(APIView):
         unauthorized = serializer.validated_data['unauthorized']
         users_per_page = serializer.validated_data['users_per_page']
         page_number = serializer.validated_data['page_number']
-        users = User.nodes.order_by('first_name', 'last_name')
-        if unauthorized:
-            users = users.filter(authorized=False, role__ne='admin')
-        else:
-            users = users.filter(role__ne='admin')
+        users = repository.users(unauthorized=unauthorized)
         count = len(users)
         paginator = Paginator(users, users_per_page)
         try:
@@ -300,12 +394,15 @@ class UserView(APIView):
         serializer = UsernameSerializer(data=request.query_params)
         serializer.is_valid(raise_exception=True)
         username = serializer.validated_data['user']
-        try:
-            user = User.nodes.get(username=username)
-        except User.DoesNotExist:
+        user = repository.get_user(username)
+        if user is None:
             return Response(data={"user": ["There is no user with the given username"]},
                             status=status.HTTP_404_NOT_FOUND)
-        user.delete()
+        # Forgotten once deleted, so that a concurrent request cannot cache the token again
+        key = repository.token_key(user)
+        repository.delete_user(user)
+        if key is not None:
+            forget_token(key)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -324,11 +421,13 @@ class UserDetailsView(APIView):
         """
         serializer = ChangePasswordSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        if not check_password(serializer.validated_data['old_password'], request.user.password):
+        correct, _ = password_hasher.check_password(serializer.validated_data['old_password'], request.user.password)
+        if not correct:
             return Response(data={"old_password": ["Incorrect old password"]}, status=status.HTTP_403_FORBIDDEN)
         user = request.user
-        user.password = make_password(serializer.validated_data['new_password'])
-        user.save()
+        user.password = password_hasher.make_password(serializer.validated_data['new_password'])
+        repository.save_user(user)
+        forget_token(request.auth.key)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     def put(self, request):
@@ -344,5 +443,23 @@ class UserDetailsView(APIView):
         user.gender = serializer.validated_data['gender']
         user.city = serializer.validated_data['city']
         user.address = serializer.validated_data.get('address', None)
-        user.save()
+        repository.save_user(user)
+        forget_token(request.auth.key)
         return Response(data=UserBaseSerializer(user).data, status=status.HTTP_200_OK)
+
+
+class MetricsView(APIView):
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        """
+        Retrieve the per-view request duration and Cypher query count histograms of the serving worker
+        """
+        return Response(data={"pid": os.getpid(), "views": view_metrics.to_dict()}, status=status.HTTP_200_OK)
+
+    def delete(self, request):
+        """
+        Reset the metrics of the serving worker
+        """
+        view_metrics.clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)